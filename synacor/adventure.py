@@ -1,18 +1,14 @@
 from __future__ import annotations
 
+import itertools
 import logging
-import subprocess
-from typing import IO
+from collections.abc import Iterator
+
+from synacor import vm
 
 logger = logging.getLogger(__name__)
 
-CMD = [
-    'python',
-    '-m',
-    'synacor',
-    'vm',
-    'spec/challenge.bin',
-]
+FILEPATH = 'spec/challenge.bin'
 
 STEPS = [
     'take tablet',
@@ -105,31 +101,12 @@ STEPS = [
 
 
 def main(interactive: bool) -> int:
-    with subprocess.Popen(CMD, stdin=subprocess.PIPE) as proc:
-        if proc.stdin is None:
-            logger.error('Failed to start process')
-            return 1
-
-        stdin: IO[bytes] = proc.stdin
-
-        def write(s: str) -> None:
-            stdin.write(f'{s}\n'.encode())
-            stdin.flush()
-
-        for step in STEPS:
-            write(step)
-
-        if interactive:
-            while proc.poll() is None:
-                try:
-                    command = input()
-                except EOFError:
-                    break
+    commands: Iterator[str] = iter(STEPS)
 
-                write(command)
+    if interactive:
+        commands = itertools.chain(commands, vm.prompt())
 
-    returncode = proc.poll()
-    return returncode if isinstance(returncode, int) else 1
+    return vm.main(FILEPATH, commands=commands)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import logging
+import os
+import sys
+from typing import NamedTuple
+
+from synacor.vm import Status
+from synacor.vm import VM
+
+logger = logging.getLogger(__name__)
+
+FILEPATH = 'spec/challenge.bin'
+
+
+class Script(NamedTuple):
+    name: str
+    commands: tuple[str, ...]
+
+
+class Result(NamedTuple):
+    name: str
+    status: str
+    instructions: int
+    output: str
+
+
+class Worker:
+    def __init__(
+            self,
+            filepath: str,
+            engine: str,
+            max_steps: int | None,
+    ) -> None:
+        self.max_steps = max_steps
+        self.vm = VM(filepath, engine)
+        self.greeting = self.vm.boot()
+        self.boot = self.vm.snapshot()
+        self.boot_count = self.vm.count
+
+    def run(self, script: Script) -> Result:
+        vm = self.vm
+        vm.restore(self.boot)
+        vm.debug = False
+        vm.pending.clear()
+        vm.commands = iter(script.commands)
+        vm.count = self.boot_count
+
+        output = bytearray(self.greeting)
+        vm.output.sink = output
+
+        try:
+            status = vm.run(self.max_steps).value
+        except Exception as e:
+            logger.error('script %s failed: %r', script.name, e)
+            status = 'error'
+
+        return Result(script.name, status, vm.count, output.decode('latin-1'))
+
+
+# each process of the pool keeps its own worker between scripts
+worker: Worker | None = None
+
+
+def init_worker(filepath: str, engine: str, max_steps: int | None) -> None:
+    global worker
+    worker = Worker(filepath, engine, max_steps)
+
+
+def run_script(script: Script) -> Result:
+    assert worker is not None, 'Worker was not initialized'
+    return worker.run(script)
+
+
+def parse_commands(name: str, data: object) -> tuple[str, ...]:
+    if not isinstance(data, list) or not all(
+            isinstance(command, str) for command in data
+    ):
+        raise ValueError(f'{name} is not a list of commands')
+
+    return tuple(str(command) for command in data)
+
+
+def load_scripts(path: str) -> list[Script]:
+    scripts: list[Script] = []
+    data: object
+
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            filepath = os.path.join(path, filename)
+
+            with open(filepath) as file:
+                if filename.endswith('.json'):
+                    data = json.load(file)
+                    commands = parse_commands(filename, data)
+                else:
+                    commands = tuple(file.read().splitlines())
+
+            scripts.append(Script(filename, commands))
+
+        return scripts
+
+    with open(path) as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+
+            name = f'{path}:{number}'
+            data = json.loads(line)
+
+            # either a bare list of commands or {"name": ..., "steps": ...}
+            if isinstance(data, dict):
+                name = str(data.get('name', name))
+                data = data.get('steps')
+
+            scripts.append(Script(name, parse_commands(name, data)))
+
+    return scripts
+
+
+def main(
+        path: str,
+        filepath: str = FILEPATH,
+        engine: str = 'block',
+        jobs: int | None = None,
+        max_steps: int | None = None,
+        output: str | None = None,
+) -> int:
+    scripts = load_scripts(path)
+    jobs = jobs or os.cpu_count() or 1
+    logger.info('running %d scripts on %d processes', len(scripts), jobs)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(filepath, engine, max_steps),
+    ) as executor:
+        results = list(
+            executor.map(
+                run_script,
+                scripts,
+                chunksize=max(1, len(scripts) // (4 * jobs)),
+            ),
+        )
+
+    lines = ''.join(f'{json.dumps(result._asdict())}\n' for result in results)
+
+    if output is None:
+        sys.stdout.write(lines)
+    else:
+        with open(output, mode='w') as file:
+            file.write(lines)
+
+    failed = [r.name for r in results if r.status != Status.HALTED.value]
+    logger.info(
+        '%d scripts halted, %d did not',
+        len(results) - len(failed),
+        len(failed),
+    )
+
+    return 1 if failed else 0
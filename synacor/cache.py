@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.environ.get('SYNACOR_CACHE') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'synacor',
+)
+# total bytes of entries kept, the least recently used ones go first
+MAX_SIZE = 1 << 20
+
+
+def key(solver: str, inputs: tuple[object, ...]) -> str:
+    # repr is stable for the literals and builtin functions puzzles use
+    digest = hashlib.blake2b(repr(inputs).encode(), digest_size=16)
+    return f'{solver}-{digest.hexdigest()}'
+
+
+def lookup(
+        solver: str,
+        inputs: tuple[object, ...],
+        directory: str = DIRECTORY,
+) -> object:
+    filepath = os.path.join(directory, f'{key(solver, inputs)}.json')
+    data: object
+
+    try:
+        with open(filepath) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        # reading counts as a use for the eviction order
+        os.utime(filepath)
+    except OSError:
+        pass
+
+    if not isinstance(data, dict) or 'value' not in data:
+        return None
+
+    logger.debug('found %s in cache', solver)
+    value: object = data['value']
+    return value
+
+
+def store(
+        solver: str,
+        inputs: tuple[object, ...],
+        value: object,
+        directory: str = DIRECTORY,
+        max_size: int = MAX_SIZE,
+) -> None:
+    name = key(solver, inputs)
+    entry: dict[str, object] = {'solver': solver, 'value': value}
+    data = json.dumps(entry)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+
+        # concurrent runs must never see a half written entry
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, mode='w') as file:
+            file.write(data)
+        os.replace(temporary, os.path.join(directory, f'{name}.json'))
+
+        evict(directory, max_size)
+    except OSError as e:
+        logger.warning('could not cache %s: %s', solver, e)
+
+
+def evict(directory: str, max_size: int) -> None:
+    entries: list[tuple[float, int, str]] = []
+
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                # another run evicted it in the meantime
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    size = sum(entry[1] for entry in entries)
+
+    for _, entry_size, filepath in sorted(entries):
+        if size <= max_size:
+            break
+
+        logger.debug('evicting %s from cache', filepath)
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
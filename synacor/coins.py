@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+import ast
+import bisect
 import itertools
+import json
 import logging
+import math
+from collections.abc import Iterable
+from collections.abc import Iterator
+from typing import NamedTuple
+from typing import TypeAlias
+
+from synacor import cache
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +26,682 @@ COINS = {
     'blue': 9,
 }
 
+# every _ is a slot for one coin, filled from left to right
+FORMULA = '_ + _ * _^2 + _^3 - _'
+
+# slots and their powers, sorted by slot
+Monomial: TypeAlias = 'tuple[tuple[int, int], ...]'
+Polynomial: TypeAlias = 'dict[Monomial, int]'
+# most solutions worth keeping in the cache, generated puzzles can have
+# tens of thousands
+MAX_CACHED = 1000
+
+# widest part whose values are computed once up front, wider ones are
+# split into two factors met in the middle where their monomials allow it
+# and otherwise filled one slot at a time, pruned with the bounds of the
+# slots left, which ignore that coins are distinct and so stay loose for
+# parts like the square of a long sum
+MAX_TABULATED = 4
+
+# sum of a group of slots, the coins used as a bit mask and which coin
+# went into every slot of the group
+Partial: TypeAlias = 'tuple[int, int, tuple[int, ...]]'
+# coins of a part as a mask, in slot order and the value they give it
+Option: TypeAlias = 'tuple[int, tuple[int, ...], int]'
+# coins of a part as a mask and in slot order, keyed by their value
+Table: TypeAlias = 'dict[int, list[tuple[int, tuple[int, ...]]]]'
+
+
+class Puzzle(NamedTuple):
+    formula: str
+    coins: dict[str, int]
+    result: int
+
+
+PUZZLE = Puzzle(FORMULA, COINS, RESULT)
+
+
+class Part(NamedTuple):
+    # monomials sharing slots, which makes them one independent summand
+    slots: tuple[int, ...]
+    polynomial: Polynomial
+
+
+class Factors(NamedTuple):
+    # a wide part as factor * cofactor + remainder, the cofactor uses the
+    # slots at one end of the part and the other two the rest of them
+    factor: Part
+    cofactor: Part
+    remainder: Part
+
+
+def parse(formula: str) -> tuple[int, Polynomial]:
+    # ^ is how the puzzle writes powers
+    tree = ast.parse(formula.replace('^', '**'), mode='eval')
+    slots = [0]
+    polynomial = expand(tree.body, slots)
+    return slots[0], {
+        monomial: coefficient
+        for monomial, coefficient in polynomial.items()
+        if coefficient
+    }
+
+
+def expand(node: ast.expr, slots: list[int]) -> Polynomial:
+    if isinstance(node, ast.Name) and node.id == '_':
+        slots[0] += 1
+        return {((slots[0] - 1, 1),): 1}
+
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        value: int = node.value
+        return {(): value}
+
+    if isinstance(node, ast.UnaryOp) and isinstance(
+            node.op, (ast.UAdd, ast.USub),
+    ):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        operand = expand(node.operand, slots)
+        return {m: sign * c for m, c in operand.items()}
+
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, ast.Pow):
+            base = expand(node.left, slots)
+            exponent = node.right
+
+            if not (
+                    isinstance(exponent, ast.Constant) and
+                    type(exponent.value) is int and
+                    exponent.value >= 0
+            ):
+                raise ValueError(
+                    f'Unsupported exponent {ast.unparse(exponent)}',
+                )
+
+            power: int = exponent.value
+            result: Polynomial = {(): 1}
+            for _ in range(power):
+                result = multiply(result, base)
+            return result
+
+        left = expand(node.left, slots)
+        right = expand(node.right, slots)
+
+        if isinstance(node.op, ast.Add):
+            return add(left, right, 1)
+        if isinstance(node.op, ast.Sub):
+            return add(left, right, -1)
+        if isinstance(node.op, ast.Mult):
+            return multiply(left, right)
+
+    raise ValueError(f'Unsupported expression {ast.unparse(node)}')
+
+
+def add(left: Polynomial, right: Polynomial, sign: int) -> Polynomial:
+    result = dict(left)
+
+    for monomial, coefficient in right.items():
+        result[monomial] = result.get(monomial, 0) + sign * coefficient
+
+    return result
+
+
+def multiply(left: Polynomial, right: Polynomial) -> Polynomial:
+    result: Polynomial = {}
+
+    for (a, x), (b, y) in itertools.product(left.items(), right.items()):
+        powers = dict(a)
+        for slot, power in b:
+            powers[slot] = powers.get(slot, 0) + power
+
+        monomial = tuple(sorted(powers.items()))
+        result[monomial] = result.get(monomial, 0) + x * y
+
+    return result
+
+
+def split(polynomial: Polynomial) -> list[Part]:
+    # monomials that share a slot cannot be summed up separately
+    parts: list[tuple[set[int], Polynomial]] = []
+
+    for monomial, coefficient in polynomial.items():
+        slots = {slot for slot, _ in monomial}
+        terms: Polynomial = {monomial: coefficient}
+
+        for part in [part for part in parts if part[0] & slots]:
+            parts.remove(part)
+            slots |= part[0]
+            terms.update(part[1])
+
+        parts.append((slots, terms))
+
+    return [Part(tuple(sorted(slots)), terms) for slots, terms in parts]
+
+
+def divide(
+        polynomial: Polynomial,
+        left: set[int],
+) -> tuple[Polynomial, Polynomial, Polynomial] | None:
+    # the monomials grouped by their slots outside of left, every group
+    # but the one without any of them has to be a multiple of the same
+    # polynomial over left
+    groups: dict[Monomial, Polynomial] = {}
+
+    for monomial, coefficient in polynomial.items():
+        inner = tuple(
+            (slot, power) for slot, power in monomial if slot in left
+        )
+        outer = tuple(
+            (slot, power) for slot, power in monomial if slot not in left
+        )
+        groups.setdefault(outer, {})[inner] = coefficient
+
+    remainder = groups.pop((), {})
+    if not groups:
+        return None
+
+    first = next(iter(groups.values()))
+    common = math.gcd(*first.values())
+    factor = {monomial: c // common for monomial, c in first.items()}
+    anchor, unit = next(iter(factor.items()))
+    cofactor: Polynomial = {}
+
+    for outer, group in groups.items():
+        ratio = group.get(anchor, 0) // unit
+
+        if group != {monomial: ratio * c for monomial, c in factor.items()}:
+            return None
+
+        cofactor[outer] = ratio
+
+    return factor, cofactor, remainder
+
+
+def factorize(part: Part) -> Factors | None:
+    # cut between the slots of the part as close to the middle as possible
+    cuts = sorted(
+        (abs(2 * cut - width(part)), cut) for cut in range(1, width(part))
+    )
+
+    for _, cut in cuts:
+        for left, right in (
+                (part.slots[:cut], part.slots[cut:]),
+                (part.slots[cut:], part.slots[:cut]),
+        ):
+            divided = divide(part.polynomial, set(left))
+
+            if divided is not None:
+                factor, cofactor, remainder = divided
+                return Factors(
+                    Part(left, factor),
+                    Part(right, cofactor),
+                    Part(left, remainder),
+                )
+
+    return None
+
+
+def raise_to(value: int, power: int) -> int:
+    # ** on ints is typed to maybe return a float
+    result = 1
+    for _ in range(power):
+        result *= value
+    return result
+
+
+def evaluate(part: Part, values: tuple[int, ...]) -> int:
+    # values are in the order of the slots of the part
+    index = {slot: i for i, slot in enumerate(part.slots)}
+    total = 0
+
+    for monomial, coefficient in part.polynomial.items():
+        term = coefficient
+        for slot, power in monomial:
+            value = values[index[slot]]
+            term *= value if power == 1 else raise_to(value, power)
+        total += term
+
+    return total
+
+
+def substitute(polynomial: Polynomial, slot: int, value: int) -> Polynomial:
+    result: Polynomial = {}
+
+    for monomial, coefficient in polynomial.items():
+        rest = []
+
+        for other, power in monomial:
+            if other == slot:
+                coefficient *= raise_to(value, power)
+            else:
+                rest.append((other, power))
+
+        key = tuple(rest)
+        result[key] = result.get(key, 0) + coefficient
+
+    return result
+
+
+def extremes(values: list[int], power: int) -> tuple[int, int]:
+    powers = [raise_to(value, power) for value in values]
+    return min(powers), max(powers)
+
+
+def bounds(
+        polynomial: Polynomial,
+        values: list[int],
+        powers: dict[int, tuple[int, int]] | None = None,
+) -> tuple[int, int]:
+    # interval arithmetic over any coin in any slot, loose but cheap, the
+    # extremes of every power of the values can be passed in precomputed
+    low = high = 0
+
+    for monomial, coefficient in polynomial.items():
+        term = (coefficient, coefficient)
+
+        for _, power in monomial:
+            if powers is None or power not in powers:
+                least, most = extremes(values, power)
+            else:
+                least, most = powers[power]
+
+            candidates = [
+                bound * extreme
+                for bound in term
+                for extreme in (least, most)
+            ]
+            term = (min(candidates), max(candidates))
+
+        low += term[0]
+        high += term[1]
+
+    return low, high
+
+
+class Solver:
+    def __init__(self, puzzle: Puzzle = PUZZLE) -> None:
+        count, polynomial = parse(puzzle.formula)
+        self.names = list(puzzle.coins)
+        self.values = list(puzzle.coins.values())
+        self.target = puzzle.result - polynomial.pop((), 0)
+
+        parts = split(polynomial)
+        used = {slot for part in parts for slot in part.slots}
+        # slots the formula ends up ignoring still take a coin
+        parts.extend(
+            Part((slot,), {}) for slot in range(count) if slot not in used
+        )
+
+        # powers the slots are raised to and their extremes over the coins
+        # still free, keyed by the coins already used
+        self.exponents = {
+            power
+            for monomial in polynomial
+            for _, power in monomial
+        }
+        self.extremes: dict[int, dict[int, tuple[int, int]]] = {}
+
+        # meet in the middle, the smaller half is kept in a table and the
+        # larger one streamed against it
+        self.halves: tuple[list[Part], list[Part]] = ([], [])
+        # coins every narrow part could take, with their mask and value
+        self.options: dict[tuple[int, ...], list[Option]] = {}
+        # how the wide parts factor, if they do
+        self.factors: dict[tuple[int, ...], Factors | None] = {}
+        # coins every cofactor could take keyed by its value, with the
+        # values sorted for range lookups, built once it is first needed
+        self.tables: dict[tuple[int, ...], tuple[list[int], Table]] = {}
+
+        for part in sorted(parts, key=width, reverse=True):
+            min(self.halves, key=size).append(part)
+
+            if width(part) <= MAX_TABULATED:
+                self.options[part.slots] = list(
+                    self.choices(part, range(len(self.values))),
+                )
+            else:
+                self.factors[part.slots] = factorize(part)
+
+    def choices(self, part: Part, coins: Iterable[int]) -> Iterator[Option]:
+        for chosen in itertools.permutations(coins, width(part)):
+            yield (
+                sum(1 << coin for coin in chosen),
+                chosen,
+                evaluate(part, tuple(self.values[coin] for coin in chosen)),
+            )
+
+    def solutions(self) -> Iterator[tuple[str, ...]]:
+        table_parts, stream_parts = sorted(self.halves, key=size)
+        table_limits = self.limits(table_parts)
+        stream_limits = self.limits(stream_parts)
+
+        # keyed by the sum and the coins used, so a match never has to be
+        # checked for coins both halves took
+        table: dict[tuple[int, int], list[tuple[int, ...]]] = {}
+        for total, used, coins in self.fill(
+                table_parts,
+                table_limits,
+                self.target - stream_limits[0][1],
+                self.target - stream_limits[0][0],
+        ):
+            table.setdefault((total, used), []).append(coins)
+
+        slots = [
+            slot
+            for part in (*table_parts, *stream_parts)
+            for slot in part.slots
+        ]
+
+        for total, used, coins in self.fill(
+                stream_parts,
+                stream_limits,
+                self.target - table_limits[0][1],
+                self.target - table_limits[0][0],
+        ):
+            free = [
+                1 << coin
+                for coin in range(len(self.values))
+                if not used >> coin & 1
+            ]
+
+            for masks in itertools.combinations(free, size(table_parts)):
+                key = (self.target - total, sum(masks))
+
+                for others in table.get(key, ()):
+                    names = dict(
+                        zip(
+                            slots,
+                            (self.names[coin] for coin in others + coins),
+                        ),
+                    )
+                    yield tuple(names[slot] for slot in range(len(slots)))
+
+    def limits(self, parts: list[Part]) -> list[tuple[int, int]]:
+        # least and most the parts from every index on can add up to
+        limits = [(0, 0)]
+
+        for part in reversed(parts):
+            low, high = bounds(part.polynomial, self.values)
+            limits.append((limits[-1][0] + low, limits[-1][1] + high))
+
+        limits.reverse()
+        return limits
+
+    def fill(
+            self,
+            parts: list[Part],
+            limits: list[tuple[int, int]],
+            low: int,
+            high: int,
+            i: int = 0,
+            total: int = 0,
+            used: int = 0,
+            coins: tuple[int, ...] = (),
+    ) -> Iterator[Partial]:
+        # every way to fill the parts from i on with distinct coins whose
+        # sum can still land within [low, high]
+        if total + limits[i][0] > high or total + limits[i][1] < low:
+            return
+
+        if i == len(parts):
+            yield total, used, coins
+            return
+
+        part = parts[i]
+        options: Iterable[Option] | None = self.options.get(part.slots)
+
+        if options is None:
+            # the values the rest of the parts leave room for
+            least = low - total - limits[i + 1][1]
+            most = high - total - limits[i + 1][0]
+            factors = self.factors[part.slots]
+
+            if factors is None:
+                options = self.assign(part, part.polynomial, least, most, used)
+            else:
+                options = self.meet(part, factors, least, most, used)
+
+        for mask, chosen, value in options:
+            if mask & used:
+                continue
+
+            yield from self.fill(
+                parts,
+                limits,
+                low,
+                high,
+                i + 1,
+                total + value,
+                used | mask,
+                coins + chosen,
+            )
+
+    def meet(
+            self,
+            part: Part,
+            factors: Factors,
+            low: int,
+            high: int,
+            used: int,
+    ) -> Iterator[Option]:
+        # every way to fill the factor looked up in the table of cofactors
+        # that bring the part within [low, high]
+        values, table = self.table(factors.cofactor)
+        left = factors.factor.slots
+        # whether the factor comes first in the slots of the part
+        first = left[0] == part.slots[0]
+
+        if not values:
+            return
+
+        for taken, chosen, (factor, remainder) in self.outcomes(
+                [factors.factor.polynomial, factors.remainder.polynomial],
+                left,
+                used,
+        ):
+            mask = taken ^ used
+
+            if factor:
+                bottom, top = (low, high) if factor > 0 else (high, low)
+                least = -((remainder - bottom) // factor)
+                most = (top - remainder) // factor
+            elif low <= remainder <= high:
+                least, most = values[0], values[-1]
+            else:
+                continue
+
+            start = bisect.bisect_left(values, least)
+            stop = bisect.bisect_right(values, most)
+
+            for value in values[start:stop]:
+                for others, rest in table[value]:
+                    if others & (used | mask):
+                        continue
+
+                    yield (
+                        mask | others,
+                        chosen + rest if first else rest + chosen,
+                        factor * value + remainder,
+                    )
+
+    def table(self, part: Part) -> tuple[list[int], Table]:
+        cached = self.tables.get(part.slots)
+
+        if cached is None:
+            table: Table = {}
+
+            for mask, chosen, (value,) in self.outcomes(
+                    [part.polynomial],
+                    part.slots,
+            ):
+                table.setdefault(value, []).append((mask, chosen))
+
+            cached = self.tables[part.slots] = (sorted(table), table)
+
+        return cached
+
+    def outcomes(
+            self,
+            polynomials: list[Polynomial],
+            slots: tuple[int, ...],
+            used: int = 0,
+            chosen: tuple[int, ...] = (),
+    ) -> Iterator[tuple[int, tuple[int, ...], list[int]]]:
+        # values of the polynomials for every way to fill the slots with
+        # the coins still free, one slot at a time so fills starting with
+        # the same coins share the work
+        if len(chosen) == len(slots):
+            yield used, chosen, [p.get((), 0) for p in polynomials]
+            return
+
+        slot = slots[len(chosen)]
+
+        for coin, value in enumerate(self.values):
+            if used >> coin & 1:
+                continue
+
+            yield from self.outcomes(
+                [substitute(p, slot, value) for p in polynomials],
+                slots,
+                used | 1 << coin,
+                chosen + (coin,),
+            )
+
+    def assign(
+            self,
+            part: Part,
+            polynomial: Polynomial,
+            low: int,
+            high: int,
+            used: int,
+            chosen: tuple[int, ...] = (),
+    ) -> Iterator[Option]:
+        # a part too wide to tabulate, filled one slot at a time with the
+        # remaining slots replaced by the bounds of the coins still free
+        free = [
+            coin
+            for coin in range(len(self.values))
+            if not used >> coin & 1
+        ]
+        least, most = bounds(
+            polynomial,
+            [self.values[coin] for coin in free],
+            self.powers(used),
+        )
+
+        if least > high or most < low:
+            return
+
+        if len(chosen) == width(part):
+            yield sum(1 << coin for coin in chosen), chosen, least
+            return
+
+        slot = part.slots[len(chosen)]
+
+        for coin in free:
+            yield from self.assign(
+                part,
+                substitute(polynomial, slot, self.values[coin]),
+                low,
+                high,
+                used | 1 << coin,
+                chosen + (coin,),
+            )
+
+    def powers(self, used: int) -> dict[int, tuple[int, int]]:
+        # extremes of every power of the coins still free, shared by all
+        # the nodes using the same coins
+        powers = self.extremes.get(used)
+
+        if powers is None:
+            values = [
+                value
+                for coin, value in enumerate(self.values)
+                if not used >> coin & 1
+            ]
+            powers = self.extremes[used] = {
+                power: extremes(values, power)
+                for power in self.exponents
+                if values
+            }
+
+        return powers
+
+
+def width(part: Part) -> int:
+    return len(part.slots)
+
+
+def size(parts: list[Part]) -> int:
+    return sum(width(part) for part in parts)
+
+
+def solutions(puzzle: Puzzle = PUZZLE) -> Iterator[tuple[str, ...]]:
+    inputs = tuple(puzzle)
+    cached = cache.lookup('coins', inputs)
+
+    if isinstance(cached, list):
+        entries: list[object] = cached
+        for entry in entries:
+            if isinstance(entry, list):
+                names: list[object] = entry
+                yield tuple(str(name) for name in names)
+        return
+
+    found: list[tuple[str, ...]] = []
+
+    for solution in Solver(puzzle).solutions():
+        if len(found) <= MAX_CACHED:
+            found.append(solution)
+        yield solution
+
+    if len(found) <= MAX_CACHED:
+        cache.store('coins', inputs, found)
+
+
+def parse_puzzle(name: str, data: object) -> Puzzle:
+    if not isinstance(data, dict):
+        raise ValueError(f'{name} is not a puzzle')
+
+    formula: object = data.get('formula', FORMULA)
+    coins: object = data.get('coins')
+    result: object = data.get('result')
+
+    if not isinstance(formula, str):
+        raise ValueError(f'{name} needs a formula string')
+    if not isinstance(result, int):
+        raise ValueError(f'{name} needs an integer result')
+    if not isinstance(coins, dict) or not all(
+            isinstance(value, int) for value in coins.values()
+    ):
+        raise ValueError(f'{name} needs coins mapping names to values')
+
+    values: dict[object, object] = coins
+    return Puzzle(
+        formula,
+        {str(coin): int(str(value)) for coin, value in values.items()},
+        result,
+    )
+
+
+def load_puzzle(filepath: str) -> Puzzle:
+    data: object
+
+    with open(filepath) as file:
+        data = json.load(file)
+
+    return parse_puzzle(filepath, data)
+
 
-def compute(a: int, b: int, c: int, d: int, e: int) -> int:
-    return a + b * c**2 + d**3 - e
+def main(filepath: str | None = None) -> int:
+    puzzle = PUZZLE if filepath is None else load_puzzle(filepath)
+    found = 0
 
+    for solution in solutions(puzzle):
+        combination = tuple((name, puzzle.coins[name]) for name in solution)
+        logger.info(f'Solution is {combination}')
+        found += 1
 
-def main() -> int:
-    for combination in itertools.permutations(COINS.items()):
-        if compute(*(c[1] for c in combination)) == RESULT:
-            logger.info(f'Solution is {combination}')
-            break
-    else:
+    if not found:
         logger.error('No solution found')
         return 1
 
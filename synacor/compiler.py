@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable
+from typing import cast
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+
+from synacor.decoder import Instruction
+from synacor.decoder import Kind
+from synacor.opcode import Halt
+from synacor.opcode import WaitingForInput
+from synacor.tracer import RECORD
+
+if TYPE_CHECKING:
+    from synacor.profiler import Profiler
+    from synacor.vm import VM
+
+
+logger = logging.getLogger(__name__)
+
+MAX_BLOCK_SIZE = 64
+
+
+class Mode(NamedTuple):
+    debug: bool
+    tracing: bool
+    trapping: bool
+
+
+class Cache(NamedTuple):
+    blocks: dict[int, Callable[[], int]]
+    # number of instructions in each block
+    sizes: dict[int, int]
+    # start addresses of the blocks each memory word was compiled into
+    owners: dict[int, list[int]]
+    # instructions of each block, kept for the profiler
+    contents: dict[int, tuple[Instruction, ...]]
+
+
+class BlockCompiler:
+    def __init__(self, vm: VM, max_size: int = MAX_BLOCK_SIZE) -> None:
+        self.vm = vm
+        self.max_size = max_size
+        # blocks compiled for every instrumentation mode, so switching
+        # debugging or tracing on and off never recompiles the lean code
+        self.caches: dict[Mode, Cache] = {}
+        self.mode = Mode(debug=False, tracing=False, trapping=False)
+        # set when the mode changes in the middle of a run
+        self.switched = False
+        self.blocks, self.sizes, self.owners, self.contents = self.cache()
+        self.profiler: Profiler | None = None
+        self.namespace: dict[str, object] = {
+            'w': vm.words,
+            'memory': vm.memory,
+            'stack': vm.stack,
+            'load': vm.load,
+            'out': vm.output.put,
+            'execute': self.execute,
+            'check': self.check,
+            'hooks': vm.hooks,
+        }
+
+        vm.memory.observers.append(self.invalidate)
+
+    def run(self, budget: int) -> int:
+        vm = self.vm
+        blocks = self.blocks
+        sizes = self.sizes
+        address = vm.address
+        executed = 0
+
+        try:
+            while executed < budget:
+                try:
+                    block = blocks[address]
+                except KeyError:
+                    if address < 0:
+                        # the mode changed, continue with its blocks
+                        address = ~address
+                        blocks = self.blocks
+                        sizes = self.sizes
+
+                    block = blocks.get(address) or self.compile(address)
+
+                executed += sizes[address]
+                address = block()
+        except WaitingForInput:
+            # the handler already stopped at the in instruction
+            executed -= 1
+            if self.profiler is not None:
+                self.profiler.retract(vm.address)
+            raise
+        except Halt:
+            raise
+        except BaseException:
+            vm.address = address
+            raise
+        else:
+            vm.address = address
+        finally:
+            vm.count += executed
+
+        return executed
+
+    def execute(self, address: int) -> int:
+        # instructions without a fast template run through their handler
+        vm = self.vm
+        vm.address = address
+        vm.dispatch[vm.words[address]]()
+
+        if self.switched:
+            # no address is negative, which makes run look up the blocks
+            # again without checking anything on the fast path
+            self.switched = False
+            return ~vm.address
+
+        return vm.address
+
+    def check(self, address: int) -> int | None:
+        # blocks starting on a breakpoint ask the debugger before running
+        size = self.sizes[address]
+
+        if not self.vm.debugger.check(address):
+            return None
+
+        # the block did not run and the prompt might have changed the mode
+        self.vm.count -= size
+        return ~self.vm.address
+
+    def cache(self) -> Cache:
+        try:
+            return self.caches[self.mode]
+        except KeyError:
+            cache = self.caches[self.mode] = Cache({}, {}, {}, {})
+            return cache
+
+    def switch(self) -> None:
+        mode = Mode(
+            debug=self.vm.debug,
+            tracing=self.vm.tracing,
+            trapping=self.vm.debugger.trapping,
+        )
+
+        if mode == self.mode:
+            return
+
+        # profiler hits so far belong to the blocks of the old mode
+        self.collect()
+        self.mode = mode
+        self.blocks, self.sizes, self.owners, self.contents = self.cache()
+        self.switched = True
+
+    def profile(self, profiler: Profiler) -> None:
+        # blocks count their executions in the profiler's hits
+        self.clear()
+        self.profiler = profiler
+        self.namespace['hits'] = profiler.hits
+
+    def collect(self, start: int | None = None) -> None:
+        if self.profiler is None:
+            return
+
+        starts = list(self.contents) if start is None else [start]
+        for start in starts:
+            self.profiler.collect(start, self.contents[start])
+
+    def clear(self) -> None:
+        self.collect()
+
+        for cache in self.caches.values():
+            for mapping in cache:
+                mapping.clear()
+
+    def invalidate(self, address: int) -> None:
+        for cache in self.caches.values():
+            for start in cache.owners.pop(address, ()):
+                if cache.blocks.pop(start, None) is None:
+                    continue
+
+                if cache.contents is self.contents:
+                    self.collect(start)
+                del cache.contents[start]
+
+    def compile(self, start: int) -> Callable[[], int]:
+        instructions = self.vm.instructions
+        # handlers log every instruction they run while debugging
+        fallback = self.mode.debug
+        tracing = self.mode.tracing
+        breakpoints = self.vm.debugger.breakpoints
+        # the debugger looks at every instruction while stepping or watching
+        max_size = 1 if self.mode.trapping else self.max_size
+        address = start
+        size = 0
+        contents: list[Instruction] = []
+        lines: list[str] = []
+
+        if self.mode.trapping or start in breakpoints:
+            lines.append(f'resume = check({start})')
+            lines.append('if resume is not None:')
+            lines.append('    return resume')
+
+        if self.profiler is not None:
+            lines.append(f'hits[{start}] += 1')
+
+        if tracing:
+            limit = self.vm.tracer.limit
+            lines.append(f'if len(records) >= {limit}:')
+            lines.append('    trim()')
+
+        for _ in range(max_size):
+            instruction = instructions[address]
+
+            # stop right before the breakpoint, its own block checks it
+            if address != start and address in breakpoints:
+                lines.append(f'return {address}')
+                break
+
+            if instruction.cls is None:
+                # let the handler raise if the block starts on a bad word
+                if address == start:
+                    lines.append(f'return execute({address})')
+                    contents.append(instruction)
+                    size = 1
+                else:
+                    lines.append(f'return {address}')
+                break
+
+            if tracing:
+                lines.append(trace(instruction))
+
+            if fallback:
+                lines.append(f'return execute({address})')
+            else:
+                lines.extend(translate(instruction).splitlines())
+
+            contents.append(instruction)
+            size += 1
+            address += instruction.size
+
+            if lines[-1].startswith('return '):
+                break
+        else:
+            lines.append(f'return {address}')
+
+        namespace = dict(self.namespace)
+        if tracing:
+            namespace['records'] = self.vm.tracer.records
+            namespace['trace'] = self.vm.tracer.records.extend
+            namespace['pack'] = RECORD.pack  # type: ignore[misc]
+            namespace['trim'] = self.vm.tracer.trim
+
+        # names bound as default arguments so that blocks only use fast locals
+        arguments = ', '.join(f'{name}={name}' for name in namespace)
+        body = ''.join(f'\n    {line}' for line in lines)
+        source = f'def block({arguments}):{body}'
+        exec(compile(source, f'<block {start}>', 'exec'), namespace)
+        block = cast(Callable[[], int], namespace['block'])
+
+        for word in range(start, max(address, start + 1)):
+            self.owners.setdefault(word, []).append(start)
+
+        self.blocks[start] = block
+        self.sizes[start] = size
+        self.contents[start] = tuple(contents)
+        return block
+
+
+def translate(instruction: Instruction) -> str:
+    assert instruction.cls is not None, 'Cannot translate invalid opcode'
+
+    address = instruction.address
+    next_address = address + instruction.size
+    operands = [
+        operand(word, kind, address + i)
+        for i, (word, kind) in enumerate(
+            zip(instruction.operands, instruction.kinds), start=1,
+        )
+    ]
+    operands += [''] * (3 - len(operands))
+
+    target = ''
+    if instruction.operands:
+        a = instruction.operands[0]
+        kind = instruction.kinds[0]
+        target = f'w[{a}]' if kind is Kind.REGISTER else f'memory[{a}]'
+
+    template = instruction.cls.template
+    source = template.format(
+        a=operands[0],
+        b=operands[1],
+        c=operands[2],
+        target=target,
+        address=address,
+        next=next_address,
+    )
+
+    # a write into memory might change code in this very block
+    if '{target}' in template and target.startswith('memory'):
+        source += f'\nreturn {next_address}'
+
+    return source
+
+
+def trace(instruction: Instruction) -> str:
+    address = instruction.address
+    operands = [f'{word}' for word in instruction.operands]
+    # values are read before the instruction changes any of them
+    values = [
+        operand(word, kind, address + i)
+        for i, (word, kind) in enumerate(
+            zip(instruction.operands, instruction.kinds), start=1,
+        )
+    ]
+    padding = ['0'] * (3 - len(operands))
+    fields = [f'{address}', f'{instruction.opcode}']
+    fields += operands + padding + values + padding
+
+    return f'trace(pack({", ".join(fields)}))'
+
+
+def operand(word: int, kind: Kind, address: int) -> str:
+    if kind is Kind.LITERAL:
+        return f'{word}'
+    elif kind is Kind.REGISTER:
+        return f'w[{word}]'
+    else:
+        # invalid values raise when the instruction runs, not when compiled
+        return f'load({address})'
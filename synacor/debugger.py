@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from collections.abc import Iterator
+from collections.abc import Sequence
+from types import CodeType
+from typing import Callable
+from typing import TYPE_CHECKING
+
+from synacor.decoder import Instruction
+from synacor.decoder import Kind
+from synacor.opcode import Halt
+from synacor.opcode import MEMORY_SIZE
+from synacor.opcode import REGISTER_COUNT
+
+if TYPE_CHECKING:
+    from synacor.vm import VM
+
+
+logger = logging.getLogger(__name__)
+
+PROMPT = '(synacor) '
+
+# instructions which store their result into operand a
+STORES = frozenset((
+    'set', 'pop', 'eq', 'gt', 'add', 'mult', 'mod',
+    'and', 'or', 'not', 'rmem', 'in',
+))
+
+HELP = '''\
+c, continue                  resume the program
+s, step [N]                  run N instructions and stop again
+b, break ADDRESS [CONDITION] stop before ADDRESS, optionally only when the
+                             python CONDITION over r0-r7, pc, memory and
+                             stack is true
+d, delete ADDRESS            remove a breakpoint
+w, watch LOCATION [r|w|rw]   stop before an instruction reads or writes
+                             a memory address or register r0-r7
+u, unwatch LOCATION          remove a watchpoint
+l, list                      show breakpoints and watchpoints
+r, registers                 show registers and the stack
+x ADDRESS [N]                show N words of memory
+dis [ADDRESS] [N]            disassemble N instructions
+set LOCATION VALUE           change a memory word or register
+jump ADDRESS                 continue at another address
+q, quit                      halt the VM'''
+
+
+class Debugger:
+    def __init__(self, vm: VM) -> None:
+        self.vm = vm
+        # conditions of the breakpoints, None stops every time
+        self.breakpoints: dict[int, tuple[str, CodeType] | None] = {}
+        # watched memory addresses and registers with 'r', 'w' or 'rw'
+        self.watches: dict[int, str] = {}
+        # instructions left to run before stopping again
+        self.steps = 0
+        # address to run through once after the prompt was left
+        self.skip: int | None = None
+        self.commands: Iterator[str] | None = None
+        self.handlers: dict[str, Callable[[list[str]], bool]] = {
+            'c': self.resume,
+            'continue': self.resume,
+            's': self.step,
+            'step': self.step,
+            'b': self.add_breakpoint,
+            'break': self.add_breakpoint,
+            'd': self.delete_breakpoint,
+            'delete': self.delete_breakpoint,
+            'w': self.add_watch,
+            'watch': self.add_watch,
+            'u': self.delete_watch,
+            'unwatch': self.delete_watch,
+            'l': self.list_points,
+            'list': self.list_points,
+            'r': self.registers,
+            'registers': self.registers,
+            'x': self.examine,
+            'dis': self.disassemble,
+            'set': self.set_location,
+            'jump': self.jump,
+            'q': self.quit,
+            'quit': self.quit,
+            'help': self.help,
+        }
+
+    @property
+    def trapping(self) -> bool:
+        # only stepping and watchpoints need to look at every instruction
+        return bool(self.steps or self.watches)
+
+    def check(self, address: int) -> bool:
+        if address == self.skip:
+            self.skip = None
+            return False
+
+        reason = None
+
+        if self.steps:
+            self.steps -= 1
+            if not self.steps:
+                reason = 'step'
+                self.vm.engine.switch()
+
+        if address in self.breakpoints and self.condition(address):
+            reason = 'breakpoint'
+
+        if self.watches:
+            reason = self.watched(address) or reason
+
+        if reason is None:
+            return False
+
+        self.vm.address = address
+        self.write(f'stopped at {reason}')
+        self.repl()
+        # the prompt may have changed anything, so run from where it left
+        self.skip = self.vm.address
+        return True
+
+    def condition(self, address: int) -> bool:
+        condition = self.breakpoints[address]
+
+        if condition is None:
+            return True
+
+        words = self.vm.words
+        names: dict[str, object] = {
+            f'r{register}': words[MEMORY_SIZE + register]
+            for register in range(REGISTER_COUNT)
+        }
+        names.update(pc=address, memory=words, stack=self.vm.stack)
+
+        # conditions only get to see the VM, not the builtins
+        builtins: dict[str, object] = {}
+        scope: dict[str, object] = {'__builtins__': builtins}
+
+        try:
+            result: object = eval(condition[1], scope, names)
+            return bool(result)
+        except Exception as e:
+            # a broken condition must not end the game, stop to fix it
+            self.write(f'error in condition {condition[0]!r}: {e!r}')
+            return True
+
+    def watched(self, address: int) -> str | None:
+        reads, writes = accesses(
+            self.vm.instructions[address],
+            self.vm.words,
+        )
+
+        for location, kinds in self.watches.items():
+            if 'r' in kinds and location in reads:
+                return f'read of {format_location(location)}'
+            if 'w' in kinds and location in writes:
+                return f'write of {format_location(location)}'
+
+        return None
+
+    def repl(self) -> None:
+        if self.commands is None:
+            self.commands = prompt()
+
+        self.show(self.vm.address)
+
+        for line in self.commands:
+            name, *arguments = line.split(maxsplit=2) or ['']
+
+            if not name:
+                continue
+
+            handler = self.handlers.get(name)
+            if handler is None:
+                self.write(f'unknown command {name!r}, try help')
+                continue
+
+            try:
+                if handler(arguments):
+                    return
+            except (ValueError, IndexError) as e:
+                self.write(f'error: {e}')
+
+    def write(self, message: str) -> None:
+        # keep the debugger apart from what the game prints
+        sys.stderr.write(f'{message}\n')
+        sys.stderr.flush()
+
+    def show(self, address: int, count: int = 1) -> None:
+        for _ in range(count):
+            if address >= MEMORY_SIZE:
+                break
+
+            instruction = self.vm.instructions[address]
+            marker = '=>' if address == self.vm.address else '  '
+            self.write(f'{marker} {instruction}')
+            address += instruction.size
+
+    def resume(self, arguments: list[str]) -> bool:
+        return True
+
+    def step(self, arguments: list[str]) -> bool:
+        self.steps = int(arguments[0]) if arguments else 1
+        self.vm.engine.switch()
+        return True
+
+    def add_breakpoint(self, arguments: list[str]) -> bool:
+        address = parse_location(arguments[0])
+
+        if address >= MEMORY_SIZE:
+            raise ValueError('Breakpoints need a memory address')
+
+        condition = None
+        if len(arguments) > 1:
+            source = arguments[1]
+
+            try:
+                code = compile(source, f'<breakpoint {address}>', 'eval')
+            except SyntaxError as e:
+                raise ValueError(f'Invalid condition {source!r}: {e.msg}')
+
+            condition = (source, code)
+
+        self.breakpoints[address] = condition
+        # blocks running through the address must stop there now
+        self.vm.engine.invalidate(address)
+        return False
+
+    def delete_breakpoint(self, arguments: list[str]) -> bool:
+        address = parse_location(arguments[0])
+
+        if address not in self.breakpoints:
+            raise ValueError(f'No breakpoint at {address}')
+
+        del self.breakpoints[address]
+        self.vm.engine.invalidate(address)
+        return False
+
+    def add_watch(self, arguments: list[str]) -> bool:
+        location = parse_location(arguments[0])
+        kinds = arguments[1] if len(arguments) > 1 else 'w'
+
+        if not kinds or set(kinds) - {'r', 'w'}:
+            raise ValueError(f'Invalid watch kind {kinds}')
+
+        self.watches[location] = kinds
+        self.vm.engine.switch()
+        return False
+
+    def delete_watch(self, arguments: list[str]) -> bool:
+        location = parse_location(arguments[0])
+
+        if location not in self.watches:
+            raise ValueError(f'No watch on {format_location(location)}')
+
+        del self.watches[location]
+        self.vm.engine.switch()
+        return False
+
+    def list_points(self, arguments: list[str]) -> bool:
+        for address, condition in sorted(self.breakpoints.items()):
+            source = '' if condition is None else f' {condition[0]}'
+            self.write(f'break {address}{source}')
+
+        for location, kinds in sorted(self.watches.items()):
+            self.write(f'watch {format_location(location)} {kinds}')
+
+        return False
+
+    def registers(self, arguments: list[str]) -> bool:
+        words = self.vm.words
+        self.write(
+            ' '.join(
+                f'r{register}={words[MEMORY_SIZE + register]}'
+                for register in range(REGISTER_COUNT)
+            ),
+        )
+        self.write(f'pc={self.vm.address} stack={self.vm.stack}')
+        return False
+
+    def examine(self, arguments: list[str]) -> bool:
+        address = parse_location(arguments[0])
+        count = int(arguments[1]) if len(arguments) > 1 else 8
+        words = self.vm.words[address:min(address + count, MEMORY_SIZE)]
+        self.write(f'{address}: {" ".join(f"{word}" for word in words)}')
+        return False
+
+    def disassemble(self, arguments: list[str]) -> bool:
+        address = parse_location(arguments[0]) if arguments else None
+        count = int(arguments[1]) if len(arguments) > 1 else 8
+        self.show(self.vm.address if address is None else address, count)
+        return False
+
+    def set_location(self, arguments: list[str]) -> bool:
+        location = parse_location(arguments[0])
+        value = int(arguments[1], 0)
+
+        if not 0 <= value < MEMORY_SIZE + REGISTER_COUNT:
+            raise ValueError(f'Invalid value {value}')
+
+        if location < MEMORY_SIZE:
+            self.vm.memory[location] = value
+        else:
+            self.vm.registers[location] = value
+
+        return False
+
+    def jump(self, arguments: list[str]) -> bool:
+        self.vm.address = parse_location(arguments[0])
+        return True
+
+    def quit(self, arguments: list[str]) -> bool:
+        raise Halt
+
+    def help(self, arguments: list[str]) -> bool:
+        self.write(HELP)
+        return False
+
+
+def parse_location(text: str) -> int:
+    if text.startswith('r') and text[1:].isdigit():
+        register = int(text[1:])
+
+        if register >= REGISTER_COUNT:
+            raise ValueError(f'Invalid register {text}')
+
+        return MEMORY_SIZE + register
+
+    address = int(text, 0)
+
+    if not 0 <= address < MEMORY_SIZE:
+        raise ValueError(f'Invalid address {text}')
+
+    return address
+
+
+def format_location(location: int) -> str:
+    if location < MEMORY_SIZE:
+        return f'{location}'
+
+    return f'r{location - MEMORY_SIZE}'
+
+
+def accesses(
+        instruction: Instruction,
+        words: Sequence[int],
+) -> tuple[set[int], set[int]]:
+    # memory addresses and registers the instruction reads and writes
+    reads: set[int] = set()
+    writes: set[int] = set()
+    values = instruction.resolve(words)
+
+    for i, (operand, kind) in enumerate(
+            zip(instruction.operands, instruction.kinds),
+    ):
+        if i == 0 and instruction.name in STORES:
+            writes.add(operand)
+        elif kind is Kind.REGISTER:
+            reads.add(operand)
+
+    if instruction.name == 'rmem':
+        reads.add(values[1])
+    elif instruction.name == 'wmem':
+        writes.add(values[0])
+
+    return reads, writes
+
+
+def prompt() -> Iterator[str]:
+    # the game may be reading its commands from a pipe
+    if os.isatty(0):
+        terminal = open(0, closefd=False)
+    else:
+        terminal = open('/dev/tty')
+
+    while 1:
+        sys.stderr.write(PROMPT)
+        sys.stderr.flush()
+        line = terminal.readline()
+
+        if not line:
+            return
+
+        yield line.rstrip('\n')
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import enum
+import logging
+from collections.abc import Sequence
+from typing import NamedTuple
+
+from synacor.opcode import ADDRESS_SPACE
+from synacor.opcode import MEMORY_SIZE
+from synacor.opcode import Opcode
+from synacor.opcode import OPCODES
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ARGUMENT_COUNT = max(cls.argument_count for cls in OPCODES.values())
+
+
+class Kind(enum.Enum):
+    LITERAL = 'literal'
+    REGISTER = 'register'
+    INVALID = 'invalid'
+
+
+class Instruction(NamedTuple):
+    address: int
+    opcode: int
+    cls: type[Opcode] | None
+    operands: tuple[int, ...]
+    kinds: tuple[Kind, ...]
+
+    @property
+    def name(self) -> str:
+        return 'invalid' if self.cls is None else self.cls.name
+
+    @property
+    def size(self) -> int:
+        return len(self.operands) + 1
+
+    def resolve(self, words: Sequence[int]) -> tuple[int, ...]:
+        return tuple(
+            words[operand] if kind is Kind.REGISTER else operand
+            for operand, kind in zip(self.operands, self.kinds)
+        )
+
+    def __str__(self) -> str:
+        if self.cls is None:
+            return f'{self.address}: invalid [{self.opcode}]'
+
+        return (
+            f'{self.address}: {self.name}'
+            f'[{", ".join(f"{o}" for o in self.operands)}]'
+        )
+
+
+def kind(word: int) -> Kind:
+    if word < MEMORY_SIZE:
+        return Kind.LITERAL
+    elif word < ADDRESS_SPACE:
+        return Kind.REGISTER
+    else:
+        return Kind.INVALID
+
+
+def decode(words: Sequence[int], address: int) -> Instruction:
+    opcode = words[address]
+    cls = OPCODES.get(opcode)
+
+    if cls is None:
+        return Instruction(address, opcode, None, (), ())
+
+    operands = tuple(
+        words[address + i] for i in range(1, cls.argument_count + 1)
+    )
+    kinds = tuple(kind(operand) for operand in operands)
+
+    return Instruction(address, opcode, cls, operands, kinds)
+
+
+class InstructionCache:
+    def __init__(self, words: Sequence[int]) -> None:
+        self.words = words
+        self.instructions: dict[int, Instruction] = {}
+        # every word that is part of a cached instruction
+        self.decoded: set[int] = set()
+
+    def __getitem__(self, address: int) -> Instruction:
+        try:
+            return self.instructions[address]
+        except KeyError:
+            instruction = decode(self.words, address)
+            self.instructions[address] = instruction
+            self.decoded.update(range(address, address + instruction.size))
+            return instruction
+
+    def clear(self) -> None:
+        self.instructions.clear()
+        self.decoded.clear()
+
+    def invalidate(self, address: int) -> None:
+        # most writes go to data which has never been decoded
+        if address not in self.decoded:
+            return
+
+        # the written word may be an operand of one of the instructions
+        # starting right before it
+        for start in range(address - MAX_ARGUMENT_COUNT, address + 1):
+            instruction = self.instructions.get(start)
+
+            if instruction is not None and start + instruction.size > address:
+                del self.instructions[start]
+
+        self.decoded.discard(address)
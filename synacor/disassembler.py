@@ -0,0 +1,532 @@
+from __future__ import annotations
+
+import array
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import sys
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from typing import NamedTuple
+
+from synacor import snapshot
+from synacor.debugger import STORES
+from synacor.decoder import decode
+from synacor.decoder import Instruction
+from synacor.decoder import Kind
+from synacor.opcode import MEMORY_SIZE
+from synacor.vm import map_image
+from synacor.vm import read_image
+
+
+logger = logging.getLogger(__name__)
+
+VERSION = 2
+FORMATS = ('text', 'json', 'dot')
+
+# lines joined into a single write
+CHUNK_SIZE = 4096
+
+# instructions after which execution does not fall through
+TERMINATORS = frozenset(('halt', 'jmp', 'ret', 'invalid'))
+BRANCHES = frozenset(('jmp', 'jt', 'jf'))
+
+
+class Block(NamedTuple):
+    start: int
+    # address right after the last instruction
+    end: int
+    successors: tuple[int, ...]
+    # call instructions in the block and the literal address they call
+    calls: tuple[tuple[int, int], ...]
+    # whether the block stores into memory with wmem
+    writes: bool
+
+
+class Text(NamedTuple):
+    # a run of out instructions printing literal characters
+    address: int
+    end: int
+    text: str
+
+    def __str__(self) -> str:
+        return f'{self.address}: out {self.text!r}'
+
+
+class Graph(NamedTuple):
+    checksum: str
+    blocks: dict[int, Block]
+    # entry of every function and the blocks reachable from it without
+    # following calls
+    functions: dict[int, tuple[int, ...]]
+    # jumps and calls through a register, their targets are unknown
+    unresolved: tuple[int, ...]
+
+    def callers(self, target: int) -> list[tuple[int, int]]:
+        # call sites of the target with the function each one is in
+        owners = self.owners()
+        return [
+            (site, entry)
+            for block in self.blocks.values()
+            for site, called in block.calls
+            if called == target
+            for entry in owners.get(block.start, ())
+        ]
+
+    def writers(self) -> list[Block]:
+        return [block for block in self.blocks.values() if block.writes]
+
+    def owners(self) -> dict[int, list[int]]:
+        owners: dict[int, list[int]] = {}
+
+        for entry, blocks in sorted(self.functions.items()):
+            for start in blocks:
+                owners.setdefault(start, []).append(entry)
+
+        return owners
+
+    def call_graph(self) -> dict[int, list[int]]:
+        return {
+            entry: sorted({
+                called
+                for start in blocks
+                for _, called in self.blocks[start].calls
+            })
+            for entry, blocks in self.functions.items()
+        }
+
+
+def checksum(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def target(
+        instruction: Instruction,
+        constants: dict[int, int] | None = None,
+) -> int | None:
+    # jmp and call jump to operand a, jt and jf to operand b
+    index = 0 if instruction.name in ('jmp', 'call') else 1
+    operand = instruction.operands[index]
+
+    if instruction.kinds[index] is Kind.LITERAL:
+        return operand
+    if instruction.kinds[index] is Kind.REGISTER and constants:
+        return constants.get(operand)
+
+    return None
+
+
+def track(instruction: Instruction, constants: dict[int, int]) -> None:
+    # registers known to hold a literal, as in set r0 1309; call r0
+    if instruction.name == 'call':
+        # the callee may have overwritten any of them
+        constants.clear()
+        return
+
+    if instruction.name not in STORES:
+        return
+
+    register = instruction.operands[0]
+    constants.pop(register, None)
+
+    if instruction.name == 'set' and instruction.kinds[1] is Kind.LITERAL:
+        constants[register] = instruction.operands[1]
+
+
+def read(words: Sequence[int], address: int) -> Instruction:
+    try:
+        return decode(words, address)
+    except IndexError:
+        # the operands would run past the end of the image
+        return Instruction(address, words[address], None, (), ())
+
+
+def sweep(
+        words: Sequence[int],
+        start: int = 0,
+        end: int | None = None,
+) -> Iterator[Instruction]:
+    # linear, one instruction after another whether code or data
+    end = len(words) if end is None else min(end, len(words))
+    address = start
+
+    while address < end:
+        instruction = read(words, address)
+        yield instruction
+        address += instruction.size
+
+
+def strings(
+        instructions: Iterable[Instruction],
+) -> Iterator[Instruction | Text]:
+    run: list[Instruction] = []
+
+    for instruction in instructions:
+        if instruction.name == 'out' and instruction.kinds[0] is Kind.LITERAL:
+            run.append(instruction)
+            continue
+
+        if run:
+            yield join(run)
+            run = []
+
+        yield instruction
+
+    if run:
+        yield join(run)
+
+
+def join(run: list[Instruction]) -> Instruction | Text:
+    if len(run) == 1:
+        return run[0]
+
+    return Text(
+        run[0].address,
+        run[-1].address + run[-1].size,
+        ''.join(chr(instruction.operands[0]) for instruction in run),
+    )
+
+
+def write(lines: Iterable[str], output: str | None = None) -> None:
+    # a single write per chunk of lines instead of one per line
+    file = sys.stdout if output is None else open(output, mode='w')
+
+    with contextlib.ExitStack() as stack:
+        if output is not None:
+            stack.enter_context(file)
+
+        iterator = iter(lines)
+        while chunk := ''.join(itertools.islice(iterator, CHUNK_SIZE)):
+            file.write(chunk)
+
+
+def disassemble(
+        filepath: str,
+        start: int = 0,
+        end: int | None = None,
+        decode_strings: bool = False,
+        output: str | None = None,
+) -> int:
+    with map_image(filepath) as words:
+        instructions = sweep(words, start, end)
+        records: Iterable[Instruction | Text] = instructions
+
+        if decode_strings:
+            records = strings(instructions)
+
+        write((f'{record}\n' for record in records), output)
+
+    return 0
+
+
+def build(
+        words: Sequence[int],
+        digest: str = '',
+        roots: Sequence[int] = (0,),
+) -> Graph:
+    # recursive traversal, only words reachable from the roots or a
+    # literal jump or call target are ever decoded as code
+    instructions: dict[int, Instruction] = {}
+    leaders = set(roots)
+    entries = set(roots)
+    unresolved: list[int] = []
+    pending = list(roots)
+
+    # targets found through registers, looked up again for the blocks
+    resolved: dict[int, int] = {}
+
+    while pending:
+        address = pending.pop()
+        constants: dict[int, int] = {}
+
+        while 0 <= address < len(words) and address not in instructions:
+            if address in leaders:
+                # other paths may reach the leader with other values
+                constants.clear()
+
+            instruction = read(words, address)
+            instructions[address] = instruction
+            name = instruction.name
+
+            if name in BRANCHES or name == 'call':
+                jump = target(instruction, constants)
+
+                if jump is not None and target(instruction) is None:
+                    resolved[address] = jump
+
+                if jump is None:
+                    unresolved.append(address)
+                elif jump < len(words):
+                    leaders.add(jump)
+                    pending.append(jump)
+
+                    if name == 'call':
+                        entries.add(jump)
+
+            if name in TERMINATORS or name in BRANCHES:
+                leaders.add(address + instruction.size)
+
+            track(instruction, constants)
+
+            if name in TERMINATORS:
+                break
+
+            address += instruction.size
+
+    blocks: dict[int, Block] = {}
+
+    for start in sorted(leaders & instructions.keys()):
+        address = start
+        calls: list[tuple[int, int]] = []
+        writes = False
+
+        while 1:
+            instruction = instructions[address]
+            name = instruction.name
+            address += instruction.size
+
+            if name == 'call':
+                called = resolved.get(instruction.address, target(instruction))
+                if called is not None:
+                    calls.append((instruction.address, called))
+            elif name == 'wmem':
+                writes = True
+
+            if (
+                    name in TERMINATORS or
+                    name in BRANCHES or
+                    address in leaders or
+                    address not in instructions
+            ):
+                break
+
+        successors: list[int] = []
+
+        if name in BRANCHES:
+            jump = resolved.get(instruction.address, target(instruction))
+            if jump is not None and jump in instructions:
+                successors.append(jump)
+
+        if name not in TERMINATORS and address in instructions:
+            successors.append(address)
+
+        blocks[start] = Block(
+            start, address, tuple(successors), tuple(calls), writes,
+        )
+
+    functions: dict[int, tuple[int, ...]] = {}
+
+    for entry in sorted(entries & blocks.keys()):
+        seen = {entry}
+        stack = [entry]
+
+        while stack:
+            for successor in blocks[stack.pop()].successors:
+                if successor not in seen:
+                    seen.add(successor)
+                    stack.append(successor)
+
+        functions[entry] = tuple(sorted(seen))
+
+    return Graph(digest, blocks, functions, tuple(sorted(unresolved)))
+
+
+def read_memory(filepath: str) -> tuple[array.array[int], tuple[int, ...]]:
+    # a snapshot holds the memory as the program left it, with whatever it
+    # decrypted, and where it stopped is code too
+    with open(filepath, mode='rb') as file:
+        magic = file.read(len(snapshot.MAGIC))
+
+    if magic != snapshot.MAGIC:
+        return read_image(filepath), ()
+
+    state = snapshot.load(filepath)
+    words = array.array('H')
+    words.frombytes(b''.join(state.pages))
+    return words[:MEMORY_SIZE], (state.address,)
+
+
+def to_json(graph: Graph) -> str:
+    blocks: list[object] = [
+        [
+            block.start,
+            block.end,
+            list(block.successors),
+            [list(call) for call in block.calls],
+            block.writes,
+        ]
+        for block in sorted(graph.blocks.values())
+    ]
+    functions: dict[str, object] = {
+        f'{entry}': list(blocks) for entry, blocks in graph.functions.items()
+    }
+    index: dict[str, object] = {
+        'version': VERSION,
+        'checksum': graph.checksum,
+        'blocks': blocks,
+        'functions': functions,
+        'unresolved': list(graph.unresolved),
+    }
+    return json.dumps(index)
+
+
+def integers(value: object) -> tuple[int, ...]:
+    if not isinstance(value, list):
+        raise ValueError(f'Invalid index entry {value!r}')
+
+    items: list[object] = value
+    return tuple(int(str(item)) for item in items)
+
+
+def from_json(text: str) -> Graph:
+    data: object = json.loads(text)
+
+    if not isinstance(data, dict):
+        raise ValueError('Invalid index')
+
+    index: dict[str, object] = data
+
+    if index.get('version') != VERSION:
+        raise ValueError('Unsupported index version')
+
+    rows: object = index.get('blocks')
+    functions: object = index.get('functions')
+
+    if not isinstance(rows, list) or not isinstance(functions, dict):
+        raise ValueError('Invalid index')
+
+    blocks: dict[int, Block] = {}
+    entries: list[object] = rows
+
+    for entry in entries:
+        if not isinstance(entry, list) or len(entry) != 5:
+            raise ValueError(f'Invalid block {entry!r}')
+
+        fields: list[object] = entry
+        start, end = integers(fields[:2])
+        calls: list[object] = fields[3] if isinstance(fields[3], list) else []
+        blocks[start] = Block(
+            start,
+            end,
+            integers(fields[2]),
+            tuple((site, called) for site, called in map(integers, calls)),
+            fields[4] is True,
+        )
+
+    owners: dict[object, object] = functions
+    return Graph(
+        str(index.get('checksum')),
+        blocks,
+        {int(str(key)): integers(value) for key, value in owners.items()},
+        integers(index.get('unresolved')),
+    )
+
+
+def load_index(filepath: str, digest: str) -> Graph | None:
+    try:
+        with open(filepath) as file:
+            graph = from_json(file.read())
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # built from another image or other roots
+    if graph.checksum != digest:
+        return None
+
+    return graph
+
+
+def save_index(filepath: str, graph: Graph) -> None:
+    try:
+        with open(filepath, mode='w') as file:
+            file.write(f'{to_json(graph)}\n')
+    except OSError as e:
+        logger.warning('could not save index to %s: %s', filepath, e)
+        return
+
+    logger.info('saved index to %s', filepath)
+
+
+def to_text(graph: Graph, words: Sequence[int]) -> Iterator[str]:
+    for block in sorted(graph.blocks.values()):
+        if block.start in graph.functions:
+            yield f'\nfunction {block.start}:\n'
+
+        successors = ', '.join(f'{start}' for start in block.successors)
+        yield f'block {block.start} -> {successors or "none"}\n'
+
+        address = block.start
+        while address < block.end:
+            instruction = read(words, address)
+            yield f'    {instruction}\n'
+            address += instruction.size
+
+
+def to_dot(graph: Graph) -> Iterator[str]:
+    yield 'digraph cfg {\n'
+    yield '    node [shape=box];\n'
+
+    for block in sorted(graph.blocks.values()):
+        label = f'{block.start}-{block.end}'
+        shape = ' peripheries=2' if block.start in graph.functions else ''
+        yield f'    b{block.start} [label="{label}"{shape}];\n'
+
+        for successor in block.successors:
+            yield f'    b{block.start} -> b{successor};\n'
+
+        for _, called in block.calls:
+            if called in graph.blocks:
+                yield f'    b{block.start} -> b{called} [style=dashed];\n'
+
+    yield '}\n'
+
+
+def main(
+        filepath: str,
+        output_format: str = 'text',
+        index: str | None = None,
+        roots: Sequence[int] = (),
+        callers: int | None = None,
+        writes: bool = False,
+        output: str | None = None,
+) -> int:
+    words, stopped = read_memory(filepath)
+    starts = (0, *stopped, *roots)
+    digest = checksum(words.tobytes() + repr(starts).encode())
+    index = index or f'{filepath}.cfg.json'
+
+    graph = load_index(index, digest)
+    if graph is None:
+        graph = build(words, digest, starts)
+        save_index(index, graph)
+
+    logger.info(
+        'found %d blocks in %d functions, %d jumps through registers',
+        len(graph.blocks),
+        len(graph.functions),
+        len(graph.unresolved),
+    )
+
+    lines: Iterable[str]
+
+    if callers is not None:
+        lines = (
+            f'{site}: call {callers} in function {entry}\n'
+            for site, entry in graph.callers(callers)
+        )
+    elif writes:
+        lines = (
+            f'block {block.start}-{block.end}\n' for block in graph.writers()
+        )
+    elif output_format == 'json':
+        lines = (to_json(graph), '\n')
+    elif output_format == 'dot':
+        lines = to_dot(graph)
+    else:
+        lines = to_text(graph, words)
+
+    write(lines, output)
+    return 0
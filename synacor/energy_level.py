@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from synacor import cache
+
+if TYPE_CHECKING:
+    import numpy as np
+    from numpy.typing import NDArray
+
+
+logger = logging.getLogger(__name__)
+
+MODULO = 32768
+
+# value register 7 has to hold for the teleporter check to return 6
+ENERGY_LEVEL = 25734
+# what the teleporter check expects f(4, 1) to return
+EXPECTED = 6
+# x, y and what f(x, y) has to return, keying the cached solutions
+INPUTS = (4, 1, EXPECTED, MODULO)
+
+# most rows kept around, each one takes about 1.2 MB with its int objects,
+# enough for the four rows of f(4, y) for a few values of k
+MAX_TABLES = 16
+
+# every row of the function computed so far, keyed by x and k
+tables: dict[tuple[int, int], tuple[int, ...]] = {}
+
+
+def next_row(row: tuple[int, ...], k: int) -> tuple[int, ...]:
+    # f(x, 0) = f(x - 1, k) and f(x, y) = f(x - 1, f(x, y - 1))
+    value = row[k]
+    values = [value]
+
+    for _ in range(1, MODULO):
+        value = row[value]
+        values.append(value)
+
+    return tuple(values)
+
+
+def table(x: int, k: int) -> tuple[int, ...]:
+    # every row only reads the row before it, so fill them one after
+    # another instead of recursing through millions of calls
+    start = x
+    while start > 0 and (start, k) not in tables:
+        start -= 1
+
+    row = tables.get((start, k))
+    if row is None:
+        row = tuple((y + 1) % MODULO for y in range(MODULO))
+
+    if len(tables) + x - start > MAX_TABLES:
+        tables.clear()
+
+    for level in range(start + 1, x + 1):
+        row = next_row(row, k)
+        tables[level, k] = row
+
+    return row
+
+
+def energy_level(x: int, y: int, k: int) -> int:
+    return table(x, k)[y]
+
+
+def solve(start: int, stop: int) -> list[int]:
+    # f(4, 1) for every k in [start, stop) at once, one numpy lane per k
+    import numpy as np
+
+    k = np.arange(start, stop, dtype=np.int64)
+    # f(4, 0) = f(3, k) and f(4, 1) = f(3, f(4, 0))
+    result = third_row(k, third_row(k, k))
+    values: list[int] = result.tolist()
+    return values
+
+
+def third_row(
+        k: NDArray[np.int64],
+        targets: NDArray[np.int64],
+) -> NDArray[np.int64]:
+    # rows one and two have closed forms, f(1, y) = y + k + 1 and
+    # f(2, y) = 2k + 1 + y(k + 1), so f(3, y) = 2k + 1 + f(3, y - 1)(k + 1)
+    # is filled one y after another for all lanes and read at their target
+    import numpy as np
+
+    # lanes sorted by target stop being updated once they were read, which
+    # keeps the lanes still running a contiguous suffix
+    order = np.argsort(targets, kind='stable')
+    k = k[order]
+    targets = targets[order]
+    bounds = np.searchsorted(targets, np.arange(MODULO + 1))
+
+    step = k + 1
+    base = (2 * k + 1) % MODULO
+    # f(3, 0) = f(2, k)
+    value = (base + k * step) % MODULO
+    result = np.empty_like(k)
+
+    for y in range(int(targets[-1]) + 1 if len(targets) else 0):
+        start = bounds[y]
+        stop = bounds[y + 1]
+
+        if y:
+            running = value[start:]
+            running *= step[start:]
+            running += base[start:]
+            running %= MODULO
+
+        result[start:stop] = value[start:stop]
+
+    values = np.empty_like(result)
+    values[order] = result
+    return values
+
+
+def cached_solutions() -> list[int] | None:
+    solutions = cache.lookup('energy-level', INPUTS)
+
+    if not isinstance(solutions, list):
+        return None
+
+    return [int(k) for k in solutions]
+
+
+def compute(jobs: int) -> list[int]:
+    # a few chunks per process so a slow one does not hold the rest up
+    size = -(-MODULO // (4 * jobs))
+    chunks = range(0, MODULO, size)
+    logger.info('solving %d chunks of k on %d processes', len(chunks), jobs)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        return [
+            value
+            for values in executor.map(
+                solve,
+                chunks,
+                [min(start + size, MODULO) for start in chunks],
+            )
+            for value in values
+        ]
+
+
+def main(jobs: int | None = None, output: str | None = None) -> int:
+    # writing every result needs them all, the cache only has solutions
+    solutions = None if output is not None else cached_solutions()
+
+    if solutions is None:
+        results = compute(jobs or os.cpu_count() or 1)
+
+        if output is not None:
+            with open(output, mode='w') as file:
+                file.writelines(
+                    f'{k} {value}\n' for k, value in enumerate(results)
+                )
+
+        solutions = [
+            k for k, value in enumerate(results) if value == EXPECTED
+        ]
+        cache.store('energy-level', INPUTS, solutions)
+
+    if not solutions:
+        logger.error('No energy level found')
+        return 1
+
+    for k in solutions:
+        sys.stdout.write(f'{k}\n')
+
+    return 0
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import array
+import collections
+import hashlib
+import json
+import logging
+import re
+import sys
+from typing import NamedTuple
+
+from synacor.snapshot import Snapshot
+from synacor.vm import Status
+from synacor.vm import VM
+
+logger = logging.getLogger(__name__)
+
+FILEPATH = 'spec/challenge.bin'
+
+MAX_STATES = 1000
+MAX_DEPTH = 50
+# instructions a single command may take before it counts as stuck
+COMMAND_BUDGET = 10_000_000
+
+# the game keeps the last command in memory without clearing it, so an
+# unknown word longer than any command makes the leftovers identical
+PADDING = 'x' * 40
+
+TITLE_RE = re.compile(r'^== (.+) ==$', re.MULTILINE)
+ITEMS_RE = re.compile(r'^Things of interest here:$', re.MULTILINE)
+EXITS_RE = re.compile(r'^There (?:is|are) \d+ exits?:$', re.MULTILINE)
+INVENTORY_RE = re.compile(r'^Your inventory:$', re.MULTILINE)
+
+
+class Room(NamedTuple):
+    title: str
+    items: tuple[str, ...]
+    exits: tuple[str, ...]
+
+
+class Node(NamedTuple):
+    id: int
+    parent: int | None
+    command: str | None
+    depth: int
+    room: Room
+    inventory: tuple[str, ...]
+    state: Snapshot
+
+
+class Edge(NamedTuple):
+    source: int
+    command: str
+    # None when the command ended the game or got stuck
+    target: int | None
+
+
+def parse_list(text: str, header: re.Pattern[str]) -> tuple[str, ...]:
+    match = header.search(text)
+
+    if match is None:
+        return ()
+
+    items: list[str] = []
+    for line in text[match.end():].lstrip('\n').splitlines():
+        if not line.startswith('- '):
+            break
+        items.append(line[2:])
+
+    return tuple(items)
+
+
+def parse_room(text: str) -> Room:
+    title = TITLE_RE.search(text)
+
+    return Room(
+        '' if title is None else title.group(1),
+        parse_list(text, ITEMS_RE),
+        parse_list(text, EXITS_RE),
+    )
+
+
+class Explorer:
+    def __init__(
+            self,
+            filepath: str = FILEPATH,
+            engine: str = 'block',
+            budget: int = COMMAND_BUDGET,
+    ) -> None:
+        self.budget = budget
+        self.output = bytearray()
+        self.vm = VM(filepath, engine, output=self.output)
+        # no debugger and no shortcuts, only what a player could type
+        self.vm.custom_commands = {}
+
+        self.nodes: list[Node] = []
+        self.edges: list[Edge] = []
+        # node of every state hash seen so far
+        self.seen: dict[bytes, int] = {}
+
+        self.vm.run()
+
+    def send(self, command: str) -> tuple[Status, str]:
+        self.output.clear()
+        self.vm.feed(command)
+        status = self.vm.run(self.budget)
+        return status, self.output.decode('latin-1')
+
+    def digest(self) -> bytes:
+        stack = array.array('H', self.vm.stack).tobytes()
+        return hashlib.blake2b(self.vm.words.tobytes() + stack).digest()
+
+    def settle(self, parent: Node | None, command: str | None) -> int | None:
+        # inspect the state after the command and leave the VM in a
+        # canonical one so that equal game states hash the same
+        status, inventory = self.send('inv')
+        if status is Status.WAITING:
+            status, _ = self.send(PADDING)
+        if status is Status.WAITING:
+            status, look = self.send('look')
+        if status is not Status.WAITING:
+            return None
+
+        digest = self.digest()
+        if digest in self.seen:
+            return self.seen[digest]
+
+        node = Node(
+            len(self.nodes),
+            None if parent is None else parent.id,
+            command,
+            0 if parent is None else parent.depth + 1,
+            parse_room(look),
+            parse_list(inventory, INVENTORY_RE),
+            self.vm.snapshot(),
+        )
+        self.nodes.append(node)
+        self.seen[digest] = node.id
+        return node.id
+
+    def actions(self, node: Node) -> list[str]:
+        return [
+            *node.room.exits,
+            *(f'take {item}' for item in node.room.items),
+            *(f'use {item}' for item in node.inventory),
+        ]
+
+    def path(self, node: Node) -> list[str]:
+        path: list[str] = []
+
+        while node.parent is not None:
+            assert node.command is not None
+            path.append(node.command)
+            node = self.nodes[node.parent]
+
+        return path[::-1]
+
+    def explore(
+            self,
+            max_states: int = MAX_STATES,
+            max_depth: int = MAX_DEPTH,
+    ) -> None:
+        root = self.settle(None, None)
+        if root is None:
+            raise RuntimeError('Game ended before the first command')
+
+        queue = collections.deque([root])
+
+        while queue and len(self.nodes) < max_states:
+            node = self.nodes[queue.popleft()]
+
+            if node.depth >= max_depth:
+                continue
+
+            for command in self.actions(node):
+                if len(self.nodes) >= max_states:
+                    break
+
+                # every branch resumes from its parent instead of replaying
+                self.vm.restore(node.state)
+                status, _ = self.send(command)
+
+                count = len(self.nodes)
+                target = None
+                if status is Status.WAITING:
+                    target = self.settle(node, command)
+
+                if target is not None and target >= count:
+                    queue.append(target)
+
+                self.edges.append(Edge(node.id, command, target))
+
+        logger.info(
+            'explored %d states in %d rooms with %d transitions',
+            len(self.nodes),
+            len({node.room.title for node in self.nodes}),
+            len(self.edges),
+        )
+
+    def to_json(self) -> str:
+        nodes: list[dict[str, object]] = [
+            {
+                'id': node.id,
+                'room': node.room.title,
+                'items': node.room.items,
+                'exits': node.room.exits,
+                'inventory': node.inventory,
+                'path': self.path(node),
+            }
+            for node in self.nodes
+        ]
+        edges: list[dict[str, object]] = [
+            {
+                'source': edge.source,
+                'command': edge.command,
+                'target': edge.target,
+            }
+            for edge in self.edges
+        ]
+        graph: dict[str, object] = {'nodes': nodes, 'edges': edges}
+
+        return json.dumps(graph, indent=2)
+
+
+def main(
+        filepath: str = FILEPATH,
+        max_states: int = MAX_STATES,
+        max_depth: int = MAX_DEPTH,
+        output: str | None = None,
+) -> int:
+    explorer = Explorer(filepath)
+    explorer.explore(max_states, max_depth)
+
+    if output is None:
+        sys.stdout.write(f'{explorer.to_json()}\n')
+    else:
+        with open(output, mode='w') as file:
+            file.write(f'{explorer.to_json()}\n')
+
+    return 0
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import logging
+from typing import Callable
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+
+from synacor.energy_level import energy_level
+from synacor.energy_level import MODULO
+from synacor.opcode import MEMORY_SIZE
+
+if TYPE_CHECKING:
+    from synacor.vm import VM
+
+
+logger = logging.getLogger(__name__)
+
+
+class Hook(NamedTuple):
+    address: int
+    # words of the guest routine, it is only replaced if they match
+    code: tuple[int, ...]
+    function: Callable[[VM], None]
+
+
+def teleporter_check(vm: VM) -> None:
+    # r0 = f(r0, r1) with r7 as the third argument, every path of the
+    # routine ends with r0 = r1 + 1 so r1 is left one below the result
+    words = vm.words
+    result = energy_level(
+        words[MEMORY_SIZE],
+        words[MEMORY_SIZE + 1],
+        words[MEMORY_SIZE + 7],
+    )
+    words[MEMORY_SIZE] = result
+    words[MEMORY_SIZE + 1] = (result - 1) % MODULO
+
+
+HOOKS = (
+    Hook(
+        6049,
+        (
+            7, 32768, 6057,
+            9, 32768, 32769, 1,
+            18,
+            7, 32769, 6070,
+            9, 32768, 32768, 32767,
+            1, 32769, 32775,
+            17, 6049,
+            18,
+            2, 32768,
+            9, 32769, 32769, 32767,
+            17, 6049,
+            1, 32769, 32768,
+            3, 32768,
+            9, 32768, 32768, 32767,
+            17, 6049,
+            18,
+        ),
+        teleporter_check,
+    ),
+)
+
+
+def install(vm: VM, hooks: tuple[Hook, ...] = HOOKS) -> None:
+    for hook in hooks:
+        end = hook.address + len(hook.code)
+
+        if tuple(vm.words[hook.address:end]) != hook.code:
+            continue
+
+        logger.debug('hooking routine at %d', hook.address)
+        vm.hooks[hook.address] = hook.function
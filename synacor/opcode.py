@@ -1,41 +1,64 @@
 from __future__ import annotations
 
 import logging
+import os
 import sys
 from abc import ABC
 from abc import abstractmethod
 from typing import Callable
 from typing import TYPE_CHECKING
 
+from synacor.energy_level import cached_solutions
+from synacor.energy_level import ENERGY_LEVEL
+
 if TYPE_CHECKING:
     from synacor.vm import VM
 
 
 logger = logging.getLogger(__name__)
 
+MEMORY_SIZE = 32768
+REGISTER_COUNT = 8
+ADDRESS_SPACE = MEMORY_SIZE + REGISTER_COUNT
+
+
+class Halt(Exception):
+    pass
+
+
+class WaitingForInput(Exception):
+    pass
+
 
 class Opcode(ABC):
     opcode: int
     name: str
     argument_count: int
+    # python source used by the block compiler, {a}, {b} and {c} are the
+    # operand values, {target} is where operand a stores its result and
+    # {address}/{next} are the addresses of this and the next instruction
+    template: str = 'return execute({address})'
 
     def __init__(self, vm: VM) -> None:
         self.vm = vm
 
     @abstractmethod
     def execute(self) -> None:
-        if self.vm.debug:
-            self.log_debug()
+        raise NotImplementedError
+
+    def execute_debug(self) -> None:
+        self.log_debug()
+        self.execute()
 
     def log_debug(self) -> None:
+        address = self.vm.address
+        instruction = self.vm.instructions[address]
+        values = instruction.resolve(self.vm.words)
         arguments = [
-            f'{self.vm.read_memory(self.vm.address + i)}'
-            f'={self.vm.load(self.vm.address + i)}'
-            for i in range(1, self.argument_count + 1)
+            f'{operand}={value}'
+            for operand, value in zip(instruction.operands, values)
         ]
-        message = (
-            f'[{self.vm.address}]: Executing {self.name} with {arguments=}'
-        )
+        message = f'[{address}]: Executing {self.name} with {arguments=}'
         logger.info(message)
 
 
@@ -46,243 +69,266 @@ class HaltOpcode(Opcode):
 
     def execute(self) -> None:
         logger.info('halting VM')
-        raise SystemExit(0)
+        raise Halt
 
 
 class SetOpcode(Opcode):
     opcode = 1
     name = 'set'
     argument_count = 2
+    template = '{target} = {b}'
 
     def execute(self) -> None:
-        super().execute()
-        value_a = self.vm.load(self.vm.address + 2)
-        self.vm.store(self.vm.address + 1, value_a)
-        self.vm.address += 3
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.load(address + 2))
+        vm.address = address + 3
 
 
 class PushOpcode(Opcode):
     opcode = 2
     name = 'push'
     argument_count = 1
+    template = 'stack.append({a})'
 
     def execute(self) -> None:
-        super().execute()
-        value_a = self.vm.load(self.vm.address + 1)
-        self.vm.stack.append(value_a)
-        self.vm.address += 2
+        vm = self.vm
+        address = vm.address
+        vm.stack.append(vm.load(address + 1))
+        vm.address = address + 2
 
 
 class PopOpcode(Opcode):
     opcode = 3
     name = 'pop'
     argument_count = 1
+    template = '{target} = stack.pop()'
 
     def execute(self) -> None:
-        super().execute()
-        value = self.vm.stack.pop()
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 2
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.stack.pop())
+        vm.address = address + 2
 
 
 class EqOpcode(Opcode):
     opcode = 4
     name = 'eq'
     argument_count = 3
+    template = '{target} = 1 if {b} == {c} else 0'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = 1 if value_b == value_c else 0
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        value = 1 if vm.load(address + 2) == vm.load(address + 3) else 0
+        vm.store(address + 1, value)
+        vm.address = address + 4
 
 
 class GtOpcode(Opcode):
     opcode = 5
     name = 'gt'
     argument_count = 3
+    template = '{target} = 1 if {b} > {c} else 0'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = 1 if value_b > value_c else 0
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        value = 1 if vm.load(address + 2) > vm.load(address + 3) else 0
+        vm.store(address + 1, value)
+        vm.address = address + 4
 
 
 class JmpOpcode(Opcode):
     opcode = 6
     name = 'jmp'
     argument_count = 1
+    template = 'return {a}'
 
     def execute(self) -> None:
-        super().execute()
-        self.vm.address = self.vm.load(self.vm.address + 1)
+        vm = self.vm
+        vm.address = vm.load(vm.address + 1)
 
 
 class JtOpcode(Opcode):
     opcode = 7
     name = 'jt'
     argument_count = 2
+    template = 'return {b} if {a} != 0 else {next}'
 
     def execute(self) -> None:
-        super().execute()
-        value_a = self.vm.load(self.vm.address + 1)
-        if value_a != 0:
-            self.vm.address = self.vm.load(self.vm.address + 2)
+        vm = self.vm
+        address = vm.address
+        if vm.load(address + 1) != 0:
+            vm.address = vm.load(address + 2)
         else:
-            self.vm.address += 3
+            vm.address = address + 3
 
 
 class JfOpcode(Opcode):
     opcode = 8
     name = 'jf'
     argument_count = 2
+    template = 'return {b} if {a} == 0 else {next}'
 
     def execute(self) -> None:
-        super().execute()
-        value_a = self.vm.load(self.vm.address + 1)
-        if value_a == 0:
-            self.vm.address = self.vm.load(self.vm.address + 2)
+        vm = self.vm
+        address = vm.address
+        if vm.load(address + 1) == 0:
+            vm.address = vm.load(address + 2)
         else:
-            self.vm.address += 3
+            vm.address = address + 3
 
 
 class AddOpcode(Opcode):
     opcode = 9
     name = 'add'
     argument_count = 3
+    template = '{target} = ({b} + {c}) % 32768'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = (value_b + value_c) % 32768
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        value = (vm.load(address + 2) + vm.load(address + 3)) % 32768
+        vm.store(address + 1, value)
+        vm.address = address + 4
 
 
 class MultOpcode(Opcode):
     opcode = 10
     name = 'mult'
     argument_count = 3
+    template = '{target} = ({b} * {c}) % 32768'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = (value_b * value_c) % 32768
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        value = (vm.load(address + 2) * vm.load(address + 3)) % 32768
+        vm.store(address + 1, value)
+        vm.address = address + 4
 
 
 class ModOpcode(Opcode):
     opcode = 11
     name = 'mod'
     argument_count = 3
+    template = '{target} = {b} % {c}'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = value_b % value_c
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.load(address + 2) % vm.load(address + 3))
+        vm.address = address + 4
 
 
 class AndOpcode(Opcode):
     opcode = 12
     name = 'and'
     argument_count = 3
+    template = '{target} = {b} & {c}'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = value_b & value_c
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.load(address + 2) & vm.load(address + 3))
+        vm.address = address + 4
 
 
 class OrOpcode(Opcode):
     opcode = 13
     name = 'or'
     argument_count = 3
+    template = '{target} = {b} | {c}'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value_c = self.vm.load(self.vm.address + 3)
-        value = value_b | value_c
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 4
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.load(address + 2) | vm.load(address + 3))
+        vm.address = address + 4
 
 
 class NotOpcode(Opcode):
     opcode = 14
     name = 'not'
     argument_count = 2
+    template = '{target} = ~{b} & 0x7FFF'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        value = ~value_b & 0x7FFF
-        self.vm.store(self.vm.address + 1, value)
-        self.vm.address += 3
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, ~vm.load(address + 2) & 0x7FFF)
+        vm.address = address + 3
 
 
 class RmemOpcode(Opcode):
     opcode = 15
     name = 'rmem'
     argument_count = 2
+    template = '{target} = load({b})'
 
     def execute(self) -> None:
-        super().execute()
-        value_b = self.vm.load(self.vm.address + 2)
-        memory = self.vm.load(value_b)
-        self.vm.store(self.vm.address + 1, memory)
-        self.vm.address += 3
+        vm = self.vm
+        address = vm.address
+        vm.store(address + 1, vm.load(vm.load(address + 2)))
+        vm.address = address + 3
 
 
 class WmemOpcode(Opcode):
     opcode = 16
     name = 'wmem'
     argument_count = 2
+    template = 'memory[{a}] = {b}\nreturn {next}'
 
     def execute(self) -> None:
-        super().execute()
-        value_a = self.vm.load(self.vm.address + 1)
-        value_b = self.vm.load(self.vm.address + 2)
-        self.vm.memory[value_a] = value_b
-        self.vm.address += 3
+        vm = self.vm
+        address = vm.address
+        vm.memory[vm.load(address + 1)] = vm.load(address + 2)
+        vm.address = address + 3
 
 
 class CallOpcode(Opcode):
     opcode = 17
     name = 'call'
     argument_count = 1
+    template = (
+        'if {a} in hooks:\n'
+        '    return execute({address})\n'
+        'stack.append({next})\n'
+        'return {a}'
+    )
 
     def execute(self) -> None:
-        super().execute()
-        self.vm.stack.append(self.vm.address + 2)
-        self.vm.address = self.vm.load(self.vm.address + 1)
+        vm = self.vm
+        address = vm.address
+        target = vm.load(address + 1)
+        hook = vm.hooks.get(target)
+
+        if hook is not None:
+            # as if the routine had been called and already returned
+            hook(vm)
+            vm.address = address + 2
+            return
+
+        vm.stack.append(address + 2)
+        vm.address = target
 
 
 class RetOpcode(Opcode):
     opcode = 18
     name = 'ret'
     argument_count = 0
+    template = (
+        'if stack:\n'
+        '    return stack.pop()\n'
+        'return execute({address})'
+    )
 
     def execute(self) -> None:
-        super().execute()
         try:
             top = self.vm.stack.pop()
         except IndexError:
             logger.warning('attempted to return from empty stack')
-            raise SystemExit(0)
+            raise Halt
 
         self.vm.address = top
 
@@ -291,38 +337,45 @@ class OutOpcode(Opcode):
     opcode = 19
     name = 'out'
     argument_count = 1
+    template = 'out({a})'
 
     def execute(self) -> None:
-        super().execute()
-        value = self.vm.load(self.vm.address + 1)
-        print(chr(value), end='')
-        self.vm.address += 2
+        vm = self.vm
+        address = vm.address
+        vm.output.put(vm.load(address + 1))
+        vm.address = address + 2
 
 
 def use_breakpoint(vm: VM) -> None:
     logger.info('using breakpoint')
     # stdin might be piped, so we need to reopen /dev/tty
-    sys.stdin = open('/dev/tty')
+    if not os.isatty(0):
+        sys.stdin = open('/dev/tty')
     breakpoint()
 
 
+def use_debugger(vm: VM) -> None:
+    logger.info('using debugger')
+    vm.debugger.repl()
+
+
 def set_debug(vm: VM) -> None:
     logger.info('setting debug to %s', not vm.debug)
     vm.debug = not vm.debug
 
 
-def fix_teleporter(vm: VM) -> None:
-    logger.info('fixing teleporter')
+def set_trace(vm: VM) -> None:
+    logger.info('setting trace to %s', not vm.tracing)
+    vm.tracing = not vm.tracing
 
-    # let program set register 0 to 6 to pass the check
-    vm.memory[5507] = 6
 
-    # remove calibration process call
-    vm.memory[5511] = 21
-    vm.memory[5512] = 21
+def fix_teleporter(vm: VM) -> None:
+    logger.info('fixing teleporter')
 
-    # set register 7 to the calculated energy level
-    vm.registers[32775] = 25734
+    # the calibration itself runs natively through its hook, the level is
+    # whatever energy-level solved last or the one known to work
+    solutions = cached_solutions()
+    vm.registers[32775] = solutions[0] if solutions else ENERGY_LEVEL
 
 
 class InOpcode(Opcode):
@@ -332,47 +385,49 @@ class InOpcode(Opcode):
 
     custom_commands: dict[str, Callable[[VM], None]] = {
         'use breakpoint': use_breakpoint,
+        'use debugger': use_debugger,
         'set debug': set_debug,
+        'set trace': set_trace,
         'fix teleporter': fix_teleporter,
     }
 
     def execute(self) -> None:
-        super().execute()
+        vm = self.vm
+
+        if not vm.buffer:
+            # everything printed so far is the prompt for this command
+            vm.output.flush()
 
-        if self.vm.buffer is None:
             try:
-                command = input('Enter command: ')
+                command = vm.read_command()
             except EOFError:
                 logger.info('exiting due to EOF')
-                raise SystemExit(0)
+                raise Halt
 
-            if command in self.custom_commands:
+            if command in vm.custom_commands:
                 logger.info('executing custom command: %r', command)
-                self.custom_commands[command](self.vm)
+                vm.custom_commands[command](vm)
 
-                print('\n')
-                InOpcode(self.vm).execute()
+                vm.output.write(b'\n\n')
+                self.execute()
                 return
 
-            self.vm.buffer = iter(command)
+            vm.buffer = f'{command}\n'
 
-        try:
-            value = next(self.vm.buffer)
-        except StopIteration:
-            value = '\n'
-            self.vm.buffer = None
+        value = vm.buffer[0]
+        vm.buffer = vm.buffer[1:]
 
-        self.vm.store(self.vm.address + 1, ord(value))
-        self.vm.address += 2
+        vm.store(vm.address + 1, ord(value))
+        vm.address += 2
 
 
 class NoopOpcode(Opcode):
     opcode = 21
     name = 'noop'
     argument_count = 0
+    template = 'pass'
 
     def execute(self) -> None:
-        super().execute()
         self.vm.address += 1
 
 
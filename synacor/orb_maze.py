@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-import collections
+import concurrent.futures
+import json
 import logging
-import operator
-from typing import Callable
+import os
+from collections.abc import Iterator
+from typing import NamedTuple
 from typing import TypeAlias
 
+from synacor import cache
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,84 +21,397 @@ END = (0, 3)
 
 RESULT = 30
 
-MAZE: list[list[Callable[[int, int], int] | int]] = [
-    [operator.mul, 8, operator.sub, 1],  # type: ignore[misc]
-    [4, operator.mul, 11, operator.mul],  # type: ignore[misc]
-    [operator.add, 4, operator.sub, 18],  # type: ignore[misc]
-    [22, operator.sub, 9, operator.mul],  # type: ignore[misc]
+MAZE: list[list[str | int]] = [
+    ['*', 8, '-', 1],
+    [4, '*', 11, '*'],
+    ['+', 4, '-', 18],
+    [22, '-', 9, '*'],
 ]
 
 STEPS = ((0, 1, 'east'), (1, 0, 'south'), (0, -1, 'west'), (-1, 0, 'north'))
 
-StepType: TypeAlias = 'Callable[[int, int], int] | int'
+# most moves the orb survives before it disappears
+MAX_STEPS = 12
+
+OPERATORS = ('+', '-', '*')
+
+Position: TypeAlias = 'tuple[int, int]'
+# position, value of the orb and the last operator walked over
+State: TypeAlias = 'tuple[Position, int, str | None]'
+# the state each state was reached from, or for the backward half of the
+# search the state it leads to, with the direction of that move
+Links: TypeAlias = 'dict[State, tuple[State, str] | None]'
+
+
+class Puzzle(NamedTuple):
+    maze: list[list[str | int]]
+    start: Position
+    end: Position
+    result: int
+    minimum: int = MIN
+    maximum: int = MAX
+    max_steps: int = MAX_STEPS
+
+
+PUZZLE = Puzzle(MAZE, START, END, RESULT)
+
+
+def apply(op: str, value: int, number: int) -> int:
+    if op == '+':
+        return value + number
+    if op == '-':
+        return value - number
+    return value * number
+
+
+def invert(op: str, total: int, number: int) -> int | None:
+    # value the orb had before walking onto the number, if there is one
+    if op == '+':
+        return total - number
+    if op == '-':
+        return total + number
+    if number and total % number == 0:
+        return total // number
+    return None
+
+
+class Search:
+    def __init__(self, puzzle: Puzzle) -> None:
+        self.puzzle = puzzle
+        self.cells = {
+            (x, y): cell
+            for x, row in enumerate(puzzle.maze)
+            for y, cell in enumerate(row)
+        }
+        self.operators = sorted(
+            {cell for cell in self.cells.values() if isinstance(cell, str)},
+        )
+        # moves out of every cell and into it, the orb can neither go back
+        # to the start nor leave the end
+        self.moves: dict[Position, list[tuple[Position, str]]] = {
+            position: [] for position in self.cells
+        }
+        self.entries: dict[Position, list[tuple[Position, str]]] = {
+            position: [] for position in self.cells
+        }
+
+        for (x, y), moves in self.moves.items():
+            if (x, y) == puzzle.end:
+                continue
 
+            for i, j, direction in STEPS:
+                target = (x + i, y + j)
 
-def calculate(path: list[StepType]) -> int:
-    start, *path = path
+                if target in self.cells and target != puzzle.start:
+                    moves.append((target, direction))
+                    self.entries[target].append(((x, y), direction))
 
-    assert isinstance(start, int), 'First step must be an integer'
-    value: int = start
+        # multiplying by zero forgets the value, so there is no going back
+        self.invertible = '*' not in self.operators or 0 not in [
+            cell for cell in self.cells.values() if isinstance(cell, int)
+        ]
 
-    op: Callable[[int, int], int]
+    def origin(self) -> State:
+        value = self.cells[self.puzzle.start]
+        if not isinstance(value, int):
+            raise ValueError('The orb has to start on a number')
+        return (self.puzzle.start, value, None)
 
-    for i in path:
-        if isinstance(i, int):
-            value = op(value, i)
-        else:
-            op = i
+    def goals(self) -> list[State]:
+        end = self.puzzle.end
+        cell = self.cells[end]
+        operators = [cell] if isinstance(cell, str) else self.operators
+        return [(end, self.puzzle.result, op) for op in operators]
 
-    return value
+    def forward(self, state: State) -> Iterator[tuple[State, str]]:
+        position, value, op = state
 
+        for target, direction in self.moves[position]:
+            cell = self.cells[target]
 
-def bfs() -> list[str]:
-    queue: collections.deque[
-        tuple[
-            tuple[int, int], list[StepType], list[str],
-        ]
-    ] = collections.deque()
-    queue.append((START, [MAZE[START[0]][START[1]]], []))
+            if isinstance(cell, str):
+                yield (target, value, cell), direction
+                continue
 
-    while queue:
-        nxt, path, steps = queue.popleft()
+            if op is None:
+                continue
 
-        if len(path) > 1 and nxt == START:
-            continue
+            total = apply(op, value, cell)
 
-        if len(path) > 13:
-            continue
+            if self.puzzle.minimum <= total <= self.puzzle.maximum:
+                yield (target, total, op), direction
 
-        res = calculate(path)
+    def backward(self, state: State) -> Iterator[tuple[State, str]]:
+        position, value, op = state
+        cell = self.cells[position]
 
-        if res < MIN or res > MAX:
-            continue
+        for source, direction in self.entries[position]:
+            before = self.cells[source]
+
+            if source == self.puzzle.start:
+                # the orb leaves the start without an operator
+                if isinstance(cell, str) and value == before:
+                    yield (source, value, None), direction
+            elif isinstance(cell, str):
+                if isinstance(before, str):
+                    yield (source, value, before), direction
+                    continue
 
-        if nxt == END:
-            if res == RESULT:
-                return steps
+                for last in self.operators:
+                    yield (source, value, last), direction
             else:
-                continue
+                # the operator was either walked over just before or
+                # carried over from an earlier one
+                if op is None or isinstance(before, str) and before != op:
+                    continue
+
+                previous = invert(op, value, cell)
+
+                if previous is None:
+                    continue
+
+                if self.puzzle.minimum <= previous <= self.puzzle.maximum:
+                    yield (source, previous, op), direction
+
+    def run(self, origin: State, max_steps: int) -> list[str] | None:
+        # breadth first from both ends at once, always growing the smaller
+        # frontier, until a state is reached from both sides
+        ahead: Links = {origin: None}
+        behind: Links = {goal: None for goal in self.goals()}
+        forwards = [origin]
+        backwards = list(behind)
+
+        if origin in behind:
+            return []
+
+        for _ in range(max_steps):
+            if self.invertible and len(backwards) < len(forwards):
+                backwards, meetings = self.advance(
+                    backwards, behind, ahead, backward=True,
+                )
+            else:
+                forwards, meetings = self.advance(
+                    forwards, ahead, behind, backward=False,
+                )
+
+            # every meeting of this round is at least as short as anything
+            # found later, but they can differ among themselves
+            paths = [self.join(ahead, behind, state) for state in meetings]
+            if paths:
+                return min(paths, key=len)
 
-        for i, j, direction in STEPS:
-            x, y = nxt
-            x += i
-            y += j
+        return None
 
-            if x < 0 or y < 0:
-                continue
+    def advance(
+            self,
+            frontier: list[State],
+            links: Links,
+            other: Links,
+            backward: bool,
+    ) -> tuple[list[State], list[State]]:
+        successors: list[State] = []
+        meetings: list[State] = []
+        # neither half goes on past the far end
+        stop = self.puzzle.start if backward else self.puzzle.end
 
-            if x >= len(MAZE) or y >= len(MAZE[x]):
-                continue
+        for state in frontier:
+            expand = self.backward if backward else self.forward
+
+            for nxt, direction in expand(state):
+                if nxt in links:
+                    continue
+
+                links[nxt] = (state, direction)
+
+                if nxt in other:
+                    meetings.append(nxt)
+                elif nxt[0] != stop:
+                    successors.append(nxt)
+
+        return successors, meetings
+
+    def join(self, ahead: Links, behind: Links, state: State) -> list[str]:
+        steps = rebuild(ahead, state)
+        link = behind[state]
+
+        while link is not None:
+            state, direction = link
+            steps.append(direction)
+            link = behind[state]
 
-            queue.append(((x, y), path + [MAZE[x][y]], steps + [direction]))
+        return steps
 
-    raise RuntimeError('No path found')
 
+def rebuild(links: Links, state: State) -> list[str]:
+    steps: list[str] = []
+    link = links[state]
+
+    while link is not None:
+        state, direction = link
+        steps.append(direction)
+        link = links[state]
+
+    steps.reverse()
+    return steps
+
+
+def explore(
+        puzzle: Puzzle,
+        origin: State,
+        direction: str,
+) -> list[str] | None:
+    # one first move of the puzzle, searched on its own in a worker
+    steps = Search(puzzle).run(origin, puzzle.max_steps - 1)
+    return None if steps is None else [direction, *steps]
+
+
+def bfs(puzzle: Puzzle = PUZZLE, jobs: int | None = None) -> list[str]:
+    search = Search(puzzle)
+    branches = list(search.forward(search.origin()))
+
+    for state, direction in branches:
+        if state in search.goals():
+            return [direction]
+
+    # a first move onto the end with the wrong weight goes nowhere
+    branches = [
+        (state, direction)
+        for state, direction in branches
+        if state[0] != puzzle.end
+    ]
+    puzzles = [puzzle] * len(branches)
+    origins = [state for state, _ in branches]
+    directions = [direction for _, direction in branches]
+    jobs = jobs or os.cpu_count() or 1
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(explore, puzzles, origins, directions))
+
+    # the shortest route, ties going to the earliest first move
+    paths = [steps for steps in results if steps is not None]
+    if not paths:
+        raise RuntimeError('No path found')
+
+    return min(paths, key=len)
+
+
+def parse_puzzle(name: str, data: object) -> Puzzle:
+    if not isinstance(data, dict):
+        raise ValueError(f'{name} is not a puzzle')
+
+    maze: list[list[str | int]] = []
+    rows: object = data.get('maze')
+
+    if not isinstance(rows, list) or not rows:
+        raise ValueError(f'{name} has no maze')
+
+    for row in rows:
+        if not isinstance(row, list):
+            raise ValueError(f'{name} has an invalid row {row}')
+
+        cells: list[str | int] = []
+        for cell in row:
+            if isinstance(cell, int) or cell in OPERATORS:
+                cells.append(cell if isinstance(cell, int) else str(cell))
+            else:
+                raise ValueError(f'{name} has an invalid cell {cell!r}')
+
+        maze.append(cells)
+
+    numbers: dict[str, int] = {}
+    for field in ('result', 'minimum', 'maximum', 'max_steps'):
+        value: object = data.get(field, PUZZLE._field_defaults.get(field))
+        if not isinstance(value, int):
+            raise ValueError(f'{name} needs an integer {field}')
+        numbers[field] = value
+
+    positions: list[Position] = []
+    for field in ('start', 'end'):
+        position: object = data.get(field)
+        if (
+                not isinstance(position, list) or
+                len(position) != 2 or
+                not all(isinstance(i, int) for i in position)
+        ):
+            raise ValueError(f'{name} needs a [row, column] {field}')
+        x, y = int(position[0]), int(position[1])
+        if not (0 <= x < len(maze) and 0 <= y < len(maze[x])):
+            raise ValueError(f'{name} has its {field} outside of the maze')
+        positions.append((x, y))
+
+    x, y = positions[0]
+    if not isinstance(maze[x][y], int):
+        raise ValueError(f'{name} needs a number at the start')
+
+    return Puzzle(
+        maze,
+        positions[0],
+        positions[1],
+        numbers['result'],
+        numbers['minimum'],
+        numbers['maximum'],
+        numbers['max_steps'],
+    )
+
+
+def read_puzzles(filepath: str) -> list[tuple[str, object]]:
+    # every puzzle in the file with a name to report it by
+    data: object
+
+    with open(filepath) as file:
+        data = json.load(file)
+
+    if not isinstance(data, list):
+        return [(filepath, data)]
+
+    # or a list of them
+    puzzles: list[object] = data
+    return [(f'{filepath}[{i}]', puzzle) for i, puzzle in enumerate(puzzles)]
+
+
+def load_puzzles(filepath: str) -> list[Puzzle]:
+    return [
+        parse_puzzle(name, data)
+        for name, data in read_puzzles(filepath)
+    ]
+
+
+def solve(puzzle: Puzzle = PUZZLE, jobs: int | None = None) -> list[str]:
+    inputs = tuple(puzzle)
+    cached = cache.lookup('orb-maze', inputs)
+
+    if isinstance(cached, list):
+        return [str(step) for step in cached]
+
+    steps = bfs(puzzle, jobs)
+    cache.store('orb-maze', inputs, steps)
+    return steps
+
+
+def main(filepath: str | None = None, jobs: int | None = None) -> int:
+    entries = [] if filepath is None else read_puzzles(filepath)
+    puzzles = [PUZZLE] if filepath is None else []
+    failed = 0
+
+    # an invalid puzzle must not keep the others in the file from running
+    for name, data in entries:
+        try:
+            puzzles.append(parse_puzzle(name, data))
+        except ValueError as e:
+            logger.error('%s', e)
+            failed += 1
+
+    for puzzle in puzzles:
+        try:
+            steps = solve(puzzle, jobs)
+        except RuntimeError:
+            logger.error('No path found')
+            failed += 1
+            continue
 
-def main() -> int:
-    steps = bfs()
-    logger.info('Found correct steps: %s', steps)
+        logger.info('Found correct steps: %s', steps)
 
-    return 0
+    return 1 if failed else 0
 
 
 if __name__ == '__main__':
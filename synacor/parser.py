@@ -4,8 +4,14 @@ import argparse
 import logging
 
 from synacor import adventure
+from synacor import batch
 from synacor import coins
+from synacor import disassembler
+from synacor import energy_level
+from synacor import explorer
 from synacor import orb_maze
+from synacor import server
+from synacor import tracer
 from synacor import vm
 
 
@@ -34,18 +40,262 @@ def get_parser() -> argparse.ArgumentParser:
         'vm', help='Run the Synacor Challenge binary',
     )
     vm_parser.add_argument('filepath', help='Path to the binary file')
+    vm_parser.add_argument(
+        '-e', '--engine',
+        choices=vm.ENGINES,
+        default='interpreter',
+        help='Execution engine to run the binary with',
+    )
+    vm_parser.add_argument(
+        '--load',
+        metavar='SNAPSHOT',
+        help='Resume from a snapshot instead of starting from scratch',
+    )
+    vm_parser.add_argument(
+        '--save',
+        metavar='SNAPSHOT',
+        help='Save a snapshot of the VM state when it stops',
+    )
+    vm_parser.add_argument(
+        '--profile',
+        metavar='REPORT',
+        help='Count executed instructions and write a JSON report',
+    )
+    vm_parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Record executed instructions into a compressed binary trace',
+    )
+    vm_parser.add_argument(
+        '--trace-size',
+        type=int,
+        default=tracer.CAPACITY,
+        help='Number of most recent instructions the trace keeps',
+    )
+    vm_parser.add_argument(
+        '-b', '--break',
+        dest='breakpoints',
+        metavar='ADDRESS',
+        type=int,
+        action='append',
+        help='Open the debugger before the instruction at ADDRESS',
+    )
+
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='Host concurrent game sessions over TCP or a Unix socket',
+    )
+    serve_parser.add_argument('filepath', help='Path to the binary file')
+    serve_parser.add_argument(
+        '--host',
+        default=server.HOST,
+        help='Address to listen on',
+    )
+    serve_parser.add_argument(
+        '--port',
+        type=int,
+        default=server.PORT,
+        help='Port to listen on',
+    )
+    serve_parser.add_argument(
+        '--unix',
+        metavar='PATH',
+        help='Listen on a Unix socket instead of TCP',
+    )
+    serve_parser.add_argument(
+        '-e', '--engine',
+        choices=vm.ENGINES,
+        default='block',
+        help='Execution engine to run the sessions with',
+    )
+    serve_parser.add_argument(
+        '--time-slice',
+        type=int,
+        default=vm.TIME_SLICE,
+        help='Instructions a session runs before the next one gets a turn',
+    )
+
+    batch_parser = subparsers.add_parser(
+        'batch',
+        help='Run many command scripts in parallel',
+    )
+    batch_parser.add_argument(
+        'scripts',
+        help='Directory with one script per file or a JSONL file of scripts',
+    )
+    batch_parser.add_argument(
+        '--binary',
+        default=batch.FILEPATH,
+        help='Path to the binary file',
+    )
+    batch_parser.add_argument(
+        '-e', '--engine',
+        choices=vm.ENGINES,
+        default='block',
+        help='Execution engine to run the scripts with',
+    )
+    batch_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of processes, defaults to the number of CPUs',
+    )
+    batch_parser.add_argument(
+        '--max-steps',
+        type=int,
+        help='Stop a script after this many instructions',
+    )
+    batch_parser.add_argument(
+        '-o', '--output',
+        help='Write the JSONL results to a file instead of stdout',
+    )
+
+    explore_parser = subparsers.add_parser(
+        'explore',
+        help='Map every reachable game state',
+    )
+    explore_parser.add_argument(
+        '--binary',
+        default=explorer.FILEPATH,
+        help='Path to the binary file',
+    )
+    explore_parser.add_argument(
+        '--max-states',
+        type=int,
+        default=explorer.MAX_STATES,
+        help='Stop after discovering this many distinct states',
+    )
+    explore_parser.add_argument(
+        '--max-depth',
+        type=int,
+        default=explorer.MAX_DEPTH,
+        help='Do not explore states further than this many commands away',
+    )
+    explore_parser.add_argument(
+        '-o', '--output',
+        help='Write the JSON graph to a file instead of stdout',
+    )
+
+    trace_parser = subparsers.add_parser(
+        'trace',
+        help='Decode a binary instruction trace into text',
+    )
+    trace_parser.add_argument(
+        'filepath',
+        nargs='?',
+        default=tracer.FILEPATH,
+        help='Path to the trace file',
+    )
+    trace_parser.add_argument(
+        '-n', '--last',
+        type=int,
+        help='Only decode this many of the most recent instructions',
+    )
 
-    subparsers.add_parser('coins', help='Solve the coins puzzle')
+    coins_parser = subparsers.add_parser(
+        'coins',
+        help='Solve the coins puzzle',
+    )
+    coins_parser.add_argument(
+        'puzzle',
+        nargs='?',
+        help='JSON file with a formula, coins and result to solve instead',
+    )
+
+    energy_level_parser = subparsers.add_parser(
+        'energy-level',
+        help='Find the energy level the teleporter needs',
+    )
+    energy_level_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of processes, defaults to the number of CPUs',
+    )
+    energy_level_parser.add_argument(
+        '-o', '--output',
+        help='Write f(4, 1) for every energy level into a file',
+    )
 
     dissasemble_parser = subparsers.add_parser(
         'disassemble', help='Disassemble the Synacor Challenge binary',
     )
     dissasemble_parser.add_argument('filepath', help='Path to the binary file')
+    dissasemble_parser.add_argument(
+        '--start',
+        type=int,
+        default=0,
+        help='Address to start disassembling at',
+    )
+    dissasemble_parser.add_argument(
+        '--end',
+        type=int,
+        help='Address to stop disassembling before',
+    )
+    dissasemble_parser.add_argument(
+        '-s', '--strings',
+        action='store_true',
+        help='Show runs of out instructions as the text they print',
+    )
+    dissasemble_parser.add_argument(
+        '-o', '--output',
+        help='Write to a file instead of stdout',
+    )
 
-    subparsers.add_parser(
+    cfg_parser = subparsers.add_parser(
+        'cfg',
+        help='Build the control flow graph of a binary or snapshot',
+    )
+    cfg_parser.add_argument(
+        'filepath',
+        help='Path to the binary file or a snapshot',
+    )
+    cfg_parser.add_argument(
+        '-f', '--format',
+        choices=disassembler.FORMATS,
+        default='text',
+        help='Format to write the graph in',
+    )
+    cfg_parser.add_argument(
+        '--index',
+        help='Where to keep the index, defaults to FILEPATH.cfg.json',
+    )
+    cfg_parser.add_argument(
+        '--root',
+        dest='roots',
+        metavar='ADDRESS',
+        type=int,
+        action='append',
+        help='Also follow the code starting at ADDRESS',
+    )
+    cfg_parser.add_argument(
+        '--callers',
+        metavar='ADDRESS',
+        type=int,
+        help='Only list the calls of ADDRESS',
+    )
+    cfg_parser.add_argument(
+        '--writes-memory',
+        action='store_true',
+        help='Only list the blocks writing memory',
+    )
+    cfg_parser.add_argument(
+        '-o', '--output',
+        help='Write to a file instead of stdout',
+    )
+
+    orb_maze_parser = subparsers.add_parser(
         'orb-maze',
         help='Solve the orb maze puzzle',
     )
+    orb_maze_parser.add_argument(
+        'puzzles',
+        nargs='?',
+        help='JSON file with a puzzle or a list of puzzles to solve instead',
+    )
+    orb_maze_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of processes, defaults to the number of CPUs',
+    )
 
     return parser
 
@@ -56,21 +306,93 @@ def main() -> int:
 
     command: str = args.command
     filepath: str
+    engine: str
 
     if command == 'adventure':
         interactive: bool = args.interactive
         return adventure.main(interactive)
     elif command == 'vm':
         filepath = args.filepath
-        return vm.main(filepath)
+        engine = args.engine
+        load: str | None = args.load
+        save: str | None = args.save
+        profile: str | None = args.profile
+        trace: str | None = args.trace
+        trace_size: int = args.trace_size
+        breakpoints: list[int] | None = args.breakpoints
+        return vm.main(
+            filepath,
+            engine,
+            load=load,
+            save=save,
+            profile=profile,
+            trace=trace,
+            trace_size=trace_size,
+            breakpoints=breakpoints or (),
+        )
+    elif command == 'serve':
+        filepath = args.filepath
+        host: str = args.host
+        port: int = args.port
+        unix: str | None = args.unix
+        engine = args.engine
+        time_slice: int = args.time_slice
+        return server.main(filepath, host, port, unix, engine, time_slice)
+    elif command == 'batch':
+        scripts: str = args.scripts
+        filepath = args.binary
+        engine = args.engine
+        jobs: int | None = args.jobs
+        max_steps: int | None = args.max_steps
+        output: str | None = args.output
+        return batch.main(scripts, filepath, engine, jobs, max_steps, output)
+    elif command == 'explore':
+        filepath = args.binary
+        max_states: int = args.max_states
+        max_depth: int = args.max_depth
+        graph: str | None = args.output
+        return explorer.main(filepath, max_states, max_depth, graph)
+    elif command == 'trace':
+        filepath = args.filepath
+        last: int | None = args.last
+        return tracer.main(filepath, last)
     elif command == 'disassemble':
         filepath = args.filepath
-        vm.disassemble(filepath)
-        return 0
+        start: int = args.start
+        end: int | None = args.end
+        decode_strings: bool = args.strings
+        listing: str | None = args.output
+        return disassembler.disassemble(
+            filepath, start, end, decode_strings, listing,
+        )
+    elif command == 'cfg':
+        filepath = args.filepath
+        output_format: str = args.format
+        index: str | None = args.index
+        roots: list[int] | None = args.roots
+        callers: int | None = args.callers
+        writes_memory: bool = args.writes_memory
+        destination: str | None = args.output
+        return disassembler.main(
+            filepath,
+            output_format,
+            index=index,
+            roots=roots or (),
+            callers=callers,
+            writes=writes_memory,
+            output=destination,
+        )
     elif command == 'coins':
-        return coins.main()
+        puzzle: str | None = args.puzzle
+        return coins.main(puzzle)
+    elif command == 'energy-level':
+        processes: int | None = args.jobs
+        levels: str | None = args.output
+        return energy_level.main(processes, levels)
     elif command == 'orb-maze':
-        return orb_maze.main()
+        puzzles: str | None = args.puzzles
+        workers: int | None = args.jobs
+        return orb_maze.main(puzzles, workers)
 
     logger.error(f'Unknown command {command}')
     return 1
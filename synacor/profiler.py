@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections.abc import Iterator
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+from synacor.decoder import Instruction
+from synacor.opcode import MEMORY_SIZE
+
+if TYPE_CHECKING:
+    from synacor.vm import VM
+
+
+logger = logging.getLogger(__name__)
+
+# number of addresses listed in the hot address table
+TOP = 20
+
+
+class Profiler:
+    def __init__(self, vm: VM) -> None:
+        self.vm = vm
+        # executions of the block currently compiled at each address, only
+        # spread over its instructions when the block goes away
+        self.hits = [0] * MEMORY_SIZE
+        self.counts = [0] * MEMORY_SIZE
+        self.opcodes: dict[str, int] = {}
+        self.input_time = 0.0
+        self.output_time = 0.0
+        self.start = time.perf_counter()
+
+        # time spent waiting on I/O rather than running instructions
+        if vm.commands is not None:
+            vm.commands = self.read(vm.commands)
+        # a second output does the actual writing to the original sink
+        self.output = type(vm.output)(vm.output.sink)
+        vm.output.sink = self.write
+
+        vm.engine.profile(self)
+
+    def read(self, commands: Iterator[str]) -> Iterator[str]:
+        while 1:
+            start = time.perf_counter()
+            try:
+                command = next(commands)
+            except StopIteration:
+                return
+            finally:
+                self.input_time += time.perf_counter() - start
+
+            yield command
+
+    def write(self, data: bytes) -> None:
+        start = time.perf_counter()
+        self.output.write(data)
+        self.output.flush()
+        self.output_time += time.perf_counter() - start
+
+    def collect(self, start: int, instructions: Sequence[Instruction]) -> None:
+        hits = self.hits[start]
+
+        if not hits:
+            return
+
+        self.hits[start] = 0
+        for instruction in instructions:
+            self.counts[instruction.address] += hits
+            name = instruction.name
+            self.opcodes[name] = self.opcodes.get(name, 0) + hits
+
+    def retract(self, address: int) -> None:
+        # the instruction was counted but stopped before it could run, its
+        # block may not have been collected yet so counts can dip below 0
+        name = self.vm.instructions[address].name
+        self.counts[address] -= 1
+        self.opcodes[name] = self.opcodes.get(name, 0) - 1
+
+    def report(self) -> dict[str, object]:
+        self.vm.engine.collect()
+
+        opcodes = sorted(
+            self.opcodes,
+            key=self.opcodes.__getitem__,
+            reverse=True,
+        )
+        addresses = {
+            f'{address}': count
+            for address, count in enumerate(self.counts)
+            if count
+        }
+
+        return {
+            'instructions': sum(self.counts),
+            'elapsed': time.perf_counter() - self.start,
+            'input_wait': self.input_time,
+            'output_wait': self.output_time,
+            'opcodes': {name: self.opcodes[name] for name in opcodes},
+            'addresses': addresses,
+        }
+
+    def table(self, top: int = TOP) -> str:
+        self.vm.engine.collect()
+        total = sum(self.counts) or 1
+        hottest = sorted(
+            range(MEMORY_SIZE),
+            key=self.counts.__getitem__,
+            reverse=True,
+        )[:top]
+
+        lines = [f'{"count":>12} {"share":>6}  instruction']
+        lines.extend(
+            f'{self.counts[address]:>12} '
+            f'{self.counts[address] / total:>6.1%}  '
+            f'{self.vm.instructions[address]}'
+            for address in hottest
+            if self.counts[address]
+        )
+
+        return '\n'.join(lines)
+
+    def save(self, filepath: str) -> None:
+        report = self.report()
+
+        with open(filepath, mode='w') as file:
+            file.write(f'{json.dumps(report, indent=2)}\n')
+
+        logger.info(
+            'profiled %s instructions, hottest addresses:\n%s',
+            report['instructions'],
+            self.table(),
+        )
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import itertools
+import logging
+from collections.abc import Iterator
+
+from synacor.snapshot import Snapshot
+from synacor.vm import Status
+from synacor.vm import TIME_SLICE
+from synacor.vm import VM
+
+
+logger = logging.getLogger(__name__)
+
+HOST = '127.0.0.1'
+PORT = 8023
+
+
+class Session:
+    def __init__(
+            self,
+            number: int,
+            state: Snapshot,
+            writer: asyncio.StreamWriter,
+    ) -> None:
+        self.number = number
+        # pages the session never wrote to are shared with every other one
+        self.state = state
+        self.writer = writer
+        self.pending: collections.deque[str] = collections.deque()
+        # set to an empty iterator once the client stops sending input
+        self.commands: Iterator[str] | None = None
+        self.count = 0
+        self.scheduled = False
+        self.closed = False
+
+
+class Server:
+    def __init__(
+            self,
+            filepath: str,
+            engine: str = 'block',
+            time_slice: int = TIME_SLICE,
+    ) -> None:
+        self.time_slice = time_slice
+        self.numbers = itertools.count(1)
+        self.runnable: collections.deque[Session] = collections.deque()
+        self.ready = asyncio.Event()
+
+        # a single VM runs every session, swapping their pages in and out
+        self.vm = VM(filepath, engine)
+        self.greeting = self.vm.boot()
+        self.base = self.vm.snapshot()
+        logger.info('booted %s in %d instructions', filepath, self.vm.count)
+
+    async def handle(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> None:
+        session = Session(next(self.numbers), self.base, writer)
+        logger.info('session %d connected', session.number)
+
+        writer.write(self.greeting)
+
+        try:
+            while not session.closed:
+                line = await reader.readline()
+
+                if not line:
+                    # the VM halts once it has read all pending commands
+                    session.commands = iter(())
+                    self.schedule(session)
+                    break
+
+                session.pending.append(line.decode('latin-1').rstrip('\r\n'))
+                self.schedule(session)
+                await writer.drain()
+        except ConnectionError:
+            self.close(session)
+
+    def schedule(self, session: Session) -> None:
+        if not session.scheduled and not session.closed:
+            session.scheduled = True
+            self.runnable.append(session)
+            self.ready.set()
+
+    def close(self, session: Session) -> None:
+        if session.closed:
+            return
+
+        session.closed = True
+        session.writer.close()
+        logger.info(
+            'session %d closed after %d instructions',
+            session.number,
+            session.count,
+        )
+
+    def step(self, session: Session) -> Status:
+        vm = self.vm
+        vm.restore(session.state)
+        vm.pending = session.pending
+        vm.commands = session.commands
+        vm.output.sink = session.writer.write
+
+        count = vm.count
+        try:
+            return vm.step(self.time_slice)
+        finally:
+            session.count += vm.count - count
+            session.state = vm.snapshot()
+
+    async def run(self) -> None:
+        while 1:
+            if not self.runnable:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            session = self.runnable.popleft()
+            session.scheduled = False
+
+            if session.closed:
+                continue
+
+            try:
+                status = self.step(session)
+            except Exception as e:
+                logger.exception(e)
+                status = Status.HALTED
+
+            if status is Status.EXHAUSTED:
+                self.schedule(session)
+            elif status is Status.HALTED:
+                self.close(session)
+
+            # let connections read input and send output between slices
+            await asyncio.sleep(0)
+
+
+async def serve(
+        filepath: str,
+        host: str = HOST,
+        port: int = PORT,
+        unix: str | None = None,
+        engine: str = 'block',
+        time_slice: int = TIME_SLICE,
+) -> None:
+    server = Server(filepath, engine, time_slice)
+
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+        logger.info('listening on %s', unix)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        logger.info('listening on %s:%d', host, port)
+
+    async with listener:
+        await server.run()
+
+
+def main(
+        filepath: str,
+        host: str = HOST,
+        port: int = PORT,
+        unix: str | None = None,
+        engine: str = 'block',
+        time_slice: int = TIME_SLICE,
+) -> int:
+    try:
+        asyncio.run(serve(filepath, host, port, unix, engine, time_slice))
+    except KeyboardInterrupt:
+        logger.info('shutting down')
+
+    return 0
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import array
+import logging
+import mmap
+import struct
+import sys
+from typing import NamedTuple
+
+from synacor.opcode import ADDRESS_SPACE
+
+
+logger = logging.getLogger(__name__)
+
+PAGE_SHIFT = 8
+PAGE_SIZE = 1 << PAGE_SHIFT
+# the last page only holds the registers
+PAGE_COUNT = (ADDRESS_SPACE + PAGE_SIZE - 1) // PAGE_SIZE
+
+MAGIC = b'SYNS'
+VERSION = 1
+
+# magic, version, address, stack size, buffer size
+HEADER = struct.Struct('<4sHHII')
+# memory and registers are stored right after the header so that a mapped
+# file can be cast to words without copying
+MEMORY_OFFSET = HEADER.size
+STACK_OFFSET = MEMORY_OFFSET + 2 * ADDRESS_SPACE
+
+
+class Snapshot(NamedTuple):
+    # memory followed by the registers in native byte order, split into
+    # pages that snapshots taken from the same VM share while unchanged
+    pages: tuple[bytes, ...]
+    stack: tuple[int, ...]
+    address: int
+    # characters of the current command not yet read by the program
+    buffer: str
+
+
+def to_little_endian(words: array.array[int]) -> bytes:
+    if sys.byteorder == 'big':
+        words = array.array('H', words)
+        words.byteswap()
+
+    return words.tobytes()
+
+
+def from_little_endian(data: bytes | memoryview) -> array.array[int]:
+    words = array.array('H')
+    words.frombytes(data)
+
+    if sys.byteorder == 'big':
+        words.byteswap()
+
+    return words
+
+
+def dumps(snapshot: Snapshot) -> bytes:
+    buffer = snapshot.buffer.encode('latin-1')
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        snapshot.address,
+        len(snapshot.stack),
+        len(buffer),
+    )
+    memory = to_little_endian(array.array('H', b''.join(snapshot.pages)))
+    stack = to_little_endian(array.array('H', snapshot.stack))
+
+    return b''.join((header, memory, stack, buffer))
+
+
+def loads(data: bytes | memoryview) -> Snapshot:
+    if len(data) < STACK_OFFSET:
+        raise ValueError('Snapshot is truncated')
+
+    header: tuple[bytes, int, int, int, int] = HEADER.unpack_from(data)
+    magic, version, address, stack_size, buffer_size = header
+
+    if magic != MAGIC:
+        raise ValueError('Not a snapshot')
+    if version != VERSION:
+        raise ValueError(f'Unsupported snapshot version {version}')
+
+    buffer_offset = STACK_OFFSET + 2 * stack_size
+    if len(data) != buffer_offset + buffer_size:
+        raise ValueError('Snapshot is truncated')
+
+    memory = from_little_endian(data[MEMORY_OFFSET:STACK_OFFSET]).tobytes()
+    size = 2 * PAGE_SIZE
+    pages = tuple(memory[i:i + size] for i in range(0, len(memory), size))
+    stack = from_little_endian(data[STACK_OFFSET:buffer_offset])
+    buffer = bytes(data[buffer_offset:]).decode('latin-1')
+
+    return Snapshot(pages, tuple(stack), address, buffer)
+
+
+def save(filepath: str, snapshot: Snapshot) -> None:
+    logger.info('saving snapshot to %s', filepath)
+
+    with open(filepath, mode='wb') as file:
+        file.write(dumps(snapshot))
+
+
+def load(filepath: str) -> Snapshot:
+    logger.info('loading snapshot from %s', filepath)
+
+    with open(filepath, mode='rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with mapped, memoryview(mapped) as view:
+        return loads(view)
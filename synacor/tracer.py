@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import collections
+import gzip
+import logging
+import struct
+import sys
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from synacor.opcode import OPCODES
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SYNT'
+VERSION = 1
+HEADER = struct.Struct('<4sHI')
+# address, opcode, three raw operands and their three resolved values
+RECORD = struct.Struct('<8H')
+
+FILEPATH = 'trace.bin'
+# records kept in memory, older ones are dropped
+CAPACITY = 1 << 20
+
+
+class Record(NamedTuple):
+    address: int
+    opcode: int
+    operands: tuple[int, int, int]
+    values: tuple[int, int, int]
+
+    def __str__(self) -> str:
+        cls = OPCODES.get(self.opcode)
+
+        if cls is None:
+            return f'[{self.address}]: Executing invalid [{self.opcode}]'
+
+        arguments = [
+            f'{operand}={value}'
+            for operand, value in zip(
+                self.operands[:cls.argument_count],
+                self.values[:cls.argument_count],
+            )
+        ]
+        return f'[{self.address}]: Executing {cls.name} with {arguments=}'
+
+
+class Tracer:
+    def __init__(self, capacity: int = CAPACITY) -> None:
+        self.enabled = False
+        self.capacity = capacity
+        # compiled code appends every instruction already packed, so a
+        # record costs 16 bytes and no object
+        self.records = bytearray()
+        # old records are dropped in bulk once there are twice as many
+        self.limit = 2 * capacity * RECORD.size
+
+    def __len__(self) -> int:
+        return min(len(self.records) // RECORD.size, self.capacity)
+
+    def trim(self) -> None:
+        excess = len(self.records) - self.capacity * RECORD.size
+
+        if excess > 0:
+            del self.records[:excess]
+
+    def save(self, filepath: str) -> None:
+        self.trim()
+
+        with gzip.open(filepath, mode='wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(self)))
+            file.write(self.records)
+
+        logger.info('saved %d records to %s', len(self), filepath)
+
+
+def load(filepath: str) -> Iterator[Record]:
+    with gzip.open(filepath, mode='rb') as file:
+        header: tuple[bytes, int, int] = HEADER.unpack(
+            file.read(HEADER.size),
+        )
+        magic, version, count = header
+
+        if magic != MAGIC:
+            raise ValueError(f'{filepath} is not a trace')
+        if version != VERSION:
+            raise ValueError(f'Unsupported trace version {version}')
+
+        for _ in range(count):
+            fields: tuple[int, ...] = RECORD.unpack(file.read(RECORD.size))
+            yield Record(
+                fields[0],
+                fields[1],
+                (fields[2], fields[3], fields[4]),
+                (fields[5], fields[6], fields[7]),
+            )
+
+
+def main(filepath: str = FILEPATH, last: int | None = None) -> int:
+    records: Iterator[Record] | collections.deque[Record] = load(filepath)
+
+    if last is not None:
+        records = collections.deque(records, maxlen=last)
+
+    for record in records:
+        sys.stdout.write(f'{record}\n')
+
+    return 0
@@ -1,152 +1,477 @@
 from __future__ import annotations
 
+import array
+import asyncio
+import collections
+import contextlib
+import enum
+import io
 import logging
-import struct
+import mmap
+import sys
+from collections.abc import Iterable
 from collections.abc import Iterator
-
+from collections.abc import Sequence
+from typing import Callable
+from typing import cast
+from typing import IO
+from typing import TypeAlias
+
+from synacor import hooks
+from synacor import snapshot
+from synacor import tracer
+from synacor.compiler import BlockCompiler
+from synacor.compiler import MAX_BLOCK_SIZE
+from synacor.debugger import Debugger
+from synacor.decoder import InstructionCache
+from synacor.opcode import ADDRESS_SPACE
+from synacor.opcode import fix_teleporter
+from synacor.opcode import Halt
+from synacor.opcode import InOpcode
+from synacor.opcode import MEMORY_SIZE
 from synacor.opcode import Opcode
 from synacor.opcode import OPCODES
+from synacor.opcode import WaitingForInput
+from synacor.profiler import Profiler
+from synacor.snapshot import PAGE_COUNT
+from synacor.snapshot import PAGE_SHIFT
+from synacor.snapshot import PAGE_SIZE
+from synacor.snapshot import Snapshot
+from synacor.tracer import Tracer
 
 
 logger = logging.getLogger(__name__)
 
 
+Sink: TypeAlias = 'bytearray | IO[str] | IO[bytes] | Callable[[bytes], object]'
+
+# instructions to run before giving other coroutines a chance
+TIME_SLICE = 100_000
+
+# maximum number of instructions compiled into a single block
+ENGINES = {
+    'interpreter': 1,
+    'block': MAX_BLOCK_SIZE,
+}
+
+
+class Status(enum.Enum):
+    HALTED = 'halted'
+    WAITING = 'waiting'
+    EXHAUSTED = 'exhausted'
+
+
 class VM:
-    def __init__(self, filepath: str) -> None:
+    def __init__(
+            self,
+            filepath: str,
+            engine: str = 'interpreter',
+            output: Sink | None = None,
+            commands: Iterable[str] | None = None,
+    ) -> None:
         self.memory = Memory(filepath)
+        self.words = self.memory.words
         self.stack: list[int] = []
-        self.registers = Registers()
+        self.registers = Registers(self.memory)
         self.address = 0
-        self.buffer: Iterator[str] | None = None
-        self.debug = False
+        # instructions executed so far
+        self.count = 0
+        # characters of the current command not yet read by the program
+        self.buffer = ''
+        # snapshot that all pages not marked as dirty are identical to
+        self.base: Snapshot | None = None
+        self.output = Output(output)
+        self.commands = None if commands is None else iter(commands)
+        self.custom_commands = dict(InOpcode.custom_commands)
+        # commands fed while the VM is running, read before self.commands
+        self.pending: collections.deque[str] = collections.deque()
+
+        self.opcodes = {
+            opcode: cls(self) for opcode, cls in OPCODES.items()
+        }
+        self.handlers = self.build_dispatch(debug=False)
+        self.debug_handlers = self.build_dispatch(debug=True)
+        self.dispatch = self.handlers
+        self.tracer = Tracer()
+        self.debugger = Debugger(self)
+
+        self.instructions = InstructionCache(self.words)
+        self.memory.observers.append(self.instructions.invalidate)
+        # guest routines called by address which run natively instead
+        self.hooks: dict[int, Callable[[VM], None]] = {}
+        self.engine = BlockCompiler(self, ENGINES[engine])
+        hooks.install(self)
+
+    @property
+    def debug(self) -> bool:
+        return self.dispatch is self.debug_handlers
+
+    @debug.setter
+    def debug(self, debug: bool) -> None:
+        self.dispatch = self.debug_handlers if debug else self.handlers
+        # compiled code only goes through the handlers while debugging
+        self.engine.switch()
+
+    @property
+    def tracing(self) -> bool:
+        return self.tracer.enabled
+
+    @tracing.setter
+    def tracing(self, tracing: bool) -> None:
+        self.tracer.enabled = tracing
+        # only code compiled while tracing records instructions
+        self.engine.switch()
+
+    def build_dispatch(self, debug: bool) -> list[Callable[[], None]]:
+        # every possible 16-bit word gets an entry so that the hot loop
+        # never has to check whether the opcode exists
+        dispatch: list[Callable[[], None]] = [self.invalid_opcode] * 65536
+
+        for opcode, op in self.opcodes.items():
+            dispatch[opcode] = op.execute_debug if debug else op.execute
 
-    def run(self) -> None:
+        return dispatch
+
+    def invalid_opcode(self) -> None:
+        raise ValueError(f'Invalid opcode {self.read_memory(self.address)}')
+
+    def step(self, count: int) -> Status:
+        try:
+            self.engine.run(count)
+        except Halt:
+            return Status.HALTED
+        except WaitingForInput:
+            return Status.WAITING
+        finally:
+            self.output.flush()
+
+        return Status.EXHAUSTED
+
+    def run(self, max_steps: int | None = None) -> Status:
+        return self.step(sys.maxsize if max_steps is None else max_steps)
+
+    async def run_async(
+            self,
+            commands: asyncio.Queue[str] | None = None,
+            time_slice: int = TIME_SLICE,
+    ) -> Status:
         while 1:
-            opcode = self.get_op(self.read_memory(self.address))
-            opcode.execute()
+            status = self.step(time_slice)
+
+            if status is Status.HALTED:
+                return status
+            elif status is Status.WAITING:
+                if commands is None:
+                    return status
+
+                self.feed(await commands.get())
+            else:
+                await asyncio.sleep(0)
+
+    def feed(self, command: str) -> None:
+        self.pending.append(command)
+
+    def boot(self) -> bytes:
+        # nobody sits in front of a booted VM to use the debugger
+        self.custom_commands = {'fix teleporter': fix_teleporter}
+
+        # everyone starts at the first prompt, so callers only boot once
+        greeting = bytearray()
+        self.output.sink = greeting
+        self.run()
+        return bytes(greeting)
+
+    def snapshot(self) -> Snapshot:
+        dirty = self.memory.dirty
+        # registers change all the time, their writes are not tracked
+        dirty.add(PAGE_COUNT - 1)
+
+        if self.base is None:
+            pages = [b''] * PAGE_COUNT
+            dirty.update(range(PAGE_COUNT))
+        else:
+            pages = list(self.base.pages)
+
+        for page in dirty:
+            start = page * PAGE_SIZE
+            pages[page] = self.words[start:start + PAGE_SIZE].tobytes()
+
+        dirty.clear()
+
+        snapshot = Snapshot(
+            tuple(pages),
+            tuple(self.stack),
+            self.address,
+            self.buffer,
+        )
+        self.base = snapshot
+        return snapshot
+
+    def restore(self, snapshot: Snapshot) -> None:
+        base = self.base
+        dirty = self.memory.dirty
+        dirty.add(PAGE_COUNT - 1)
+
+        for page, data in enumerate(snapshot.pages):
+            # pages shared with the last snapshot are already in place
+            if base is None or data is not base.pages[page] or page in dirty:
+                self.memory.restore_page(page, data)
+
+        dirty.clear()
+        self.base = snapshot
+
+        # compiled code holds on to the stack itself
+        self.stack[:] = snapshot.stack
+        self.address = snapshot.address
+        self.buffer = snapshot.buffer
+
+    def read_command(self) -> str:
+        if self.pending:
+            return self.pending.popleft()
+        elif self.commands is None:
+            raise WaitingForInput
+
+        try:
+            command = next(self.commands)
+        except StopIteration:
+            raise EOFError
+
+        # lines read from files still have their line ending
+        return command.removesuffix('\n')
 
     def read_memory(self, address: int) -> int:
-        value = self.memory[address]
-        return value
+        return self.words[address]
 
     def load(self, address: int) -> int:
-        value = self.read_memory(address)
+        value = self.words[address]
 
-        if value < 32768:
+        if value < MEMORY_SIZE:
             return value
-        elif value < 32776:
-            return self.registers[value]
-        else:
+
+        # registers live right after memory, so the value is their index
+        try:
+            return self.words[value]
+        except IndexError:
             raise ValueError(f'Invalid value {value}')
 
     def get_op(self, opcode: int) -> Opcode:
         try:
-            cls = OPCODES[opcode]
+            return self.opcodes[opcode]
         except KeyError:
             raise ValueError(f'Invalid opcode {opcode}')
 
-        return cls(self)
-
-    def is_register(self, register: int) -> int:
-        try:
-            self.registers[register]
-        except ValueError:
-            return False
-        return True
+    def is_register(self, register: int) -> bool:
+        return MEMORY_SIZE <= register < ADDRESS_SPACE
 
     def store(self, address: int, new_value: int) -> None:
-        value = self.read_memory(address)
+        # the operand is either a register or a memory address and both
+        # index the same address space, only memory writes are observed
+        target = self.words[address]
 
-        if self.is_register(value):
-            self.registers[value] = new_value
+        if target < MEMORY_SIZE:
+            self.memory[target] = new_value
         else:
-            self.memory[value] = new_value
+            self.words[target] = new_value
+
+
+class Output:
+    def __init__(self, sink: Sink | None = None) -> None:
+        # like print, default to whatever sys.stdout is at the time
+        self.sink = sink
+        # characters printed by the program since the last flush
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+
+    def put(self, value: int) -> None:
+        if value < 256:
+            self.buffer.append(value)
+        else:
+            # characters latin-1 has no byte for print as a placeholder
+            self.buffer += chr(value).encode('latin-1', 'replace')
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+
+        data = bytes(self.buffer)
+        self.buffer.clear()
+
+        sink = sys.stdout if self.sink is None else self.sink
+        if isinstance(sink, bytearray):
+            sink += data
+        elif callable(sink):
+            sink(data)
+        elif is_text(sink):
+            text = cast(IO[str], sink)
+            text.write(data.decode('latin-1'))
+            text.flush()
+        else:
+            binary = cast(IO[bytes], sink)
+            binary.write(data)
+            binary.flush()
 
 
 class Memory:
     def __init__(self, filepath: str) -> None:
-        self._memory: list[int] = []
-        self.filepath: str = filepath
+        self.filepath = filepath
+        self.words = array.array('H', bytes(2 * ADDRESS_SPACE))
+        self.size = 0
+        self.observers: list[Callable[[int], None]] = []
+        # pages written to since the last snapshot
+        self.dirty: set[int] = set()
+        self.load_file()
 
     def __getitem__(self, key: int) -> int:
-        return self.memory[key]
+        return self.words[key]
 
     def __setitem__(self, key: int, value: int) -> None:
-        self.memory[key] = value
+        self.words[key] = value
+        self.dirty.add(key >> PAGE_SHIFT)
 
-    @property
-    def memory(self) -> list[int]:
-        if not self._memory:
-            self.load_file()
-        return self._memory
+        for observer in self.observers:
+            observer(key)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def restore_page(self, page: int, data: bytes) -> None:
+        start = page * PAGE_SIZE
+        old = self.words[start:start + PAGE_SIZE]
+
+        if old.tobytes() == data:
+            return
+
+        new = array.array('H')
+        new.frombytes(data)
+        self.words[start:start + PAGE_SIZE] = new
+
+        for address in range(start, min(start + PAGE_SIZE, MEMORY_SIZE)):
+            if old[address - start] != new[address - start]:
+                for observer in self.observers:
+                    observer(address)
 
     def load_file(self) -> None:
-        with open(self.filepath, mode='rb') as file:
-            chunk = file.read(2)
-            while chunk != b'':
-                unpacked: tuple[int, ...] = struct.unpack('<H', chunk)
-                self._memory.append(unpacked[0])
-                chunk = file.read(2)
+        image = read_image(self.filepath)
+
+        if len(image) > MEMORY_SIZE:
+            raise ValueError(f'{self.filepath} does not fit in memory')
+
+        self.words[:len(image)] = image
+        self.size = len(image)
 
 
 class Registers:
-    def __init__(self) -> None:
-        self._registers: dict[int, int] = {
-            32768: 0,
-            32769: 0,
-            32770: 0,
-            32771: 0,
-            32772: 0,
-            32773: 0,
-            32774: 0,
-            32775: 0,
-        }
+    def __init__(self, memory: Memory) -> None:
+        self.words = memory.words
 
     def __getitem__(self, key: int) -> int:
         self.validate_register(key)
-        return self._registers[key]
+        return self.words[key]
 
     def __setitem__(self, key: int, value: int) -> None:
         self.validate_register(key)
-        self._registers[key] = value
+        self.words[key] = value
 
     def validate_register(self, register: int) -> None:
-        if register not in self._registers:
+        if not MEMORY_SIZE <= register < ADDRESS_SPACE:
             raise ValueError(f'Invalid register {register}')
 
 
-def disassemble(filepath: str) -> None:
-    memory = Memory(filepath)
-    address = 0
+def is_text(file: object) -> bool:
+    return isinstance(file, io.TextIOBase)
+
+
+def read_image(filepath: str) -> array.array[int]:
+    words = array.array('H')
+
+    with open(filepath, mode='rb') as file:
+        data = file.read()
+
+    if len(data) % 2:
+        raise ValueError(f'{filepath} has an odd number of bytes')
 
-    while address < len(memory.memory):
-        opcode = memory[address]
+    words.frombytes(data)
+
+    # the image is little-endian, array uses the native byte order
+    if sys.byteorder == 'big':
+        words.byteswap()
+
+    return words
+
+
+@contextlib.contextmanager
+def map_image(filepath: str) -> Iterator[Sequence[int]]:
+    # a zero-copy view only works when the native byte order matches
+    if sys.byteorder == 'big':
+        yield read_image(filepath)
+        return
+
+    with open(filepath, mode='rb') as file:
         try:
-            cls = OPCODES[opcode]
-        except KeyError:
-            print(f'{address}: invalid [{opcode}]')
-            address += 1
-        else:
-            arguments = [
-                memory[address + i]
-                for i in range(1, cls.argument_count + 1)
-            ]
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            yield array.array('H')
+            return
+
+    with mapped, memoryview(mapped) as view:
+        if len(view) % 2:
+            raise ValueError(f'{filepath} has an odd number of bytes')
+
+        with view.cast('H') as words:
+            yield words
+
+
+def prompt() -> Iterator[str]:
+    while 1:
+        try:
+            yield input('Enter command: ')
+        except EOFError:
+            return
+
+
+def main(
+        filepath: str,
+        engine: str = 'interpreter',
+        commands: Iterable[str] | None = None,
+        load: str | None = None,
+        save: str | None = None,
+        profile: str | None = None,
+        trace: str | None = None,
+        trace_size: int = tracer.CAPACITY,
+        breakpoints: Iterable[int] = (),
+) -> int:
+    if commands is None:
+        commands = prompt()
+
+    vm = VM(filepath, engine, commands=commands)
 
-            print(
-                f'{address}: {cls.name}'
-                f'[{", ".join(f"{a}" for a in arguments)}]',
-            )
+    if load is not None:
+        vm.restore(snapshot.load(load))
 
-            address += cls.argument_count + 1
+    profiler = None if profile is None else Profiler(vm)
 
+    vm.tracer = Tracer(trace_size)
+    if trace is not None:
+        vm.tracing = True
 
-def main(filepath: str) -> int:
-    vm = VM(filepath)
+    for address in breakpoints:
+        vm.debugger.add_breakpoint([f'{address}'])
 
     try:
         vm.run()
     except Exception as e:
         logger.exception(e)
         return 1
+    finally:
+        if save is not None:
+            snapshot.save(save, vm.snapshot())
+        if profiler is not None and profile is not None:
+            profiler.save(profile)
+        # tracing might also have been switched on with a custom command
+        if vm.tracer.records:
+            vm.tracer.save(tracer.FILEPATH if trace is None else trace)
 
     return 0
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import pathlib
+
+import pytest
+
+from synacor import cache
+
+
+def test_lookup_survives_failing_touch(
+        tmp_path: pathlib.Path,
+        monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    directory = str(tmp_path)
+    cache.store('solver', (1, 2), [3], directory=directory)
+
+    def utime(path: str) -> None:
+        raise PermissionError(path)
+
+    # as on a read only cache directory
+    monkeypatch.setattr(cache.os, 'utime', utime)
+    assert cache.lookup('solver', (1, 2), directory=directory) == [3]
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import itertools
+from collections.abc import Callable
+
+import pytest
+
+from synacor.coins import PUZZLE
+from synacor.coins import Puzzle
+from synacor.coins import Solver
+
+COINS = {
+    'a': 2,
+    'b': -3,
+    'c': 5,
+    'd': 0,
+    'e': 7,
+    'f': 11,
+    'g': 4,
+    'h': 1,
+}
+
+
+def products(v: list[int]) -> int:
+    return (v[0] + v[1]) * (v[2] + v[3]) * (v[4] + v[5])
+
+
+def nested(v: list[int]) -> int:
+    return (v[0] + v[1] * (v[2] + v[3])) * (v[4] - v[5]) ** 2
+
+
+def square(v: list[int]) -> int:
+    return (v[0] + v[1] + v[2] + v[3] + v[4]) ** 2 - v[5]
+
+
+def brute_force(
+        function: Callable[[list[int]], int],
+        slots: int,
+        result: int,
+) -> set[tuple[str, ...]]:
+    return {
+        names
+        for names in itertools.permutations(COINS, slots)
+        if function([COINS[name] for name in names]) == result
+    }
+
+
+def test_puzzle() -> None:
+    solutions = list(Solver(PUZZLE).solutions())
+    assert solutions == [('blue', 'red', 'shiny', 'concave', 'corroded')]
+
+
+# none of these split into independent summands
+@pytest.mark.parametrize(
+    ('formula', 'function'),
+    (
+        ('(_ + _) * (_ + _) * (_ + _)', products),
+        ('(_ + _ * (_ + _)) * (_ - _)^2', nested),
+        ('(_ + _ + _ + _ + _)^2 - _', square),
+    ),
+)
+@pytest.mark.parametrize('result', (0, 96, 120, 288))
+def test_non_separable_formula(
+        formula: str,
+        function: Callable[[list[int]], int],
+        result: int,
+) -> None:
+    solutions = list(Solver(Puzzle(formula, COINS, result)).solutions())
+
+    assert len(solutions) == len(set(solutions))
+    assert set(solutions) == brute_force(function, 6, result)
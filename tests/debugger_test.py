@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import pytest
+
+from synacor.vm import ENGINES
+from synacor.vm import Status
+from synacor.vm import VM
+
+FILEPATH = 'spec/challenge.bin'
+
+
+def make_vm(engine: str, commands: list[str]) -> VM:
+    vm = VM(FILEPATH, engine, output=bytearray(), commands=None)
+    vm.debugger.commands = iter(commands)
+    return vm
+
+
+def test_delete_unknown_points(capsys: pytest.CaptureFixture[str]) -> None:
+    vm = make_vm('interpreter', ['d 123', 'u r2', 'c'])
+    vm.debugger.repl()
+
+    errors = capsys.readouterr().err
+    assert 'No breakpoint at 123' in errors
+    assert 'No watch on r2' in errors
+
+
+def test_invalid_condition(capsys: pytest.CaptureFixture[str]) -> None:
+    vm = make_vm('interpreter', ['b 10 r0 ==', 'c'])
+    vm.debugger.repl()
+
+    assert 'Invalid condition' in capsys.readouterr().err
+    assert not vm.debugger.breakpoints
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_failing_condition_stops(
+        engine: str,
+        capsys: pytest.CaptureFixture[str],
+) -> None:
+    vm = make_vm(engine, ['b 0 rr0 == 1', 'c', 'c'])
+    vm.debugger.repl()
+
+    assert vm.run() is Status.WAITING
+
+    errors = capsys.readouterr().err
+    assert "NameError(\"name 'rr0' is not defined\")" in errors
+    assert 'stopped at breakpoint' in errors
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import pytest
+
+from synacor.profiler import Profiler
+from synacor.vm import ENGINES
+from synacor.vm import Status
+from synacor.vm import VM
+
+FILEPATH = 'spec/challenge.bin'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_profile_until_waiting_for_input(engine: str) -> None:
+    vm = VM(FILEPATH, engine, output=bytearray(), commands=None)
+    profiler = Profiler(vm)
+
+    assert vm.run() is Status.WAITING
+
+    report = profiler.report()
+    # the in instruction the VM stopped at never ran
+    assert profiler.opcodes.get('in', 0) == 0
+    assert all(count >= 0 for count in profiler.counts)
+    assert report['instructions'] == vm.count
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_table_collects_block_hits(engine: str) -> None:
+    vm = VM(FILEPATH, engine, output=bytearray(), commands=None)
+    profiler = Profiler(vm)
+    vm.run()
+
+    # without a report collecting the compiled blocks first
+    lines = profiler.table().splitlines()
+    assert len(lines) > 1